@@ -0,0 +1,284 @@
+"""
+Benchmark for the Pyppeteer download handler, using the local mock server.
+
+Run from the root of the repository:
+
+    python -m benchmarks.benchmark --concurrency 8 --requests 200 --output results.json
+    python -m benchmarks.benchmark -s PYPPETEER_PAGE_POOL_SIZE=8 --compare results.json
+
+Requests are sent directly to ScrapyPyppeteerDownloadHandler._download_request,
+bypassing the Scrapy engine, so the results reflect the cost of the handler and
+the browser only. Chromium memory usage is only measured if psutil is installed.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import subprocess
+import sys
+from time import perf_counter, time
+from typing import Any, Dict, List, Optional
+
+import pyppeteer
+import scrapy
+from scrapy import Request, Spider
+from scrapy.utils.reactor import install_reactor
+from scrapy.utils.test import get_crawler
+
+from scrapy_pyppeteer import __version__
+from scrapy_pyppeteer.handler import ScrapyPyppeteerDownloadHandler
+from scrapy_pyppeteer.page import PageCoroutine
+from tests.mockserver import StaticMockServer
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# "meta" builds the meta of each request: PageCoroutine objects keep their
+# results, so they must not be shared by concurrent requests
+PAGES: Dict[str, Dict[str, Any]] = {
+    "heavy_js": {
+        "path": "/benchmark/heavy_js.html",
+        "meta": lambda: {"pyppeteer_page_coroutines": [PageCoroutine("waitForSelector", "#done")]},
+    },
+    "subresources": {
+        "path": "/benchmark/subresources.html",
+        "meta": lambda: {},
+    },
+    "scroll": {
+        "path": "/scroll.html",
+        "meta": lambda: {
+            "pyppeteer_page_coroutines": [
+                PageCoroutine("waitForSelector", "div.quote"),
+                PageCoroutine("evaluate", "window.scrollBy(0, 2000)"),
+                PageCoroutine("waitForSelector", "div.quote:nth-child(11)"),
+                PageCoroutine("evaluate", "window.scrollBy(0, 2000)"),
+                PageCoroutine("waitForSelector", "div.quote:nth-child(21)"),
+            ],
+        },
+    },
+}
+
+
+def percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(len(values) * percent / 100) - 1))
+    return values[index]
+
+
+class MemorySampler:
+    """Periodically sample the resident memory of the browser processes"""
+
+    def __init__(self, handler, interval: float = 0.5) -> None:
+        self.handler = handler
+        self.interval = interval
+        self.peak = 0
+        self._task: Optional[asyncio.Future] = None
+
+    def start(self) -> None:
+        if psutil is not None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> Optional[int]:
+        if self._task is None:
+            return None
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self.sample()
+        return self.peak
+
+    def sample(self) -> None:
+        total = 0
+        for browser in self.handler.browser_pool.browsers:
+            if browser.process is None:
+                continue
+            try:
+                process = psutil.Process(browser.process.pid)
+                for proc in [process] + process.children(recursive=True):
+                    total += proc.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak = max(self.peak, total)
+
+    async def _run(self) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+
+async def run_page(handler, server, name: str, requests: int, concurrency: int) -> Dict:
+    page = PAGES[name]
+    spider = Spider("benchmark")
+    latencies: List[float] = []
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async def worker() -> None:
+        nonlocal errors
+        while not queue.empty():
+            queue.get_nowait()
+            meta = dict(page["meta"](), pyppeteer=True)
+            request = Request(server.urljoin(page["path"]), meta=meta, dont_filter=True)
+            start = perf_counter()
+            try:
+                await handler._download_request(request, spider)
+            except Exception:
+                errors += 1
+            else:
+                latencies.append(perf_counter() - start)
+
+    start = perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = perf_counter() - start
+    return {
+        "requests": requests,
+        "errors": errors,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 3),
+        "latency": {
+            "mean": round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+            "max": round(max(latencies), 4) if latencies else 0.0,
+        },
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    crawler = get_crawler(settings_dict=args.settings)
+    handler = ScrapyPyppeteerDownloadHandler(crawler)
+    await handler._launch_browser()
+    sampler = MemorySampler(handler)
+    sampler.start()
+    results = {}
+    try:
+        with StaticMockServer() as server:
+            for name in args.pages:
+                # warm up the browser(s), not included in the results
+                await run_page(handler, server, name, args.concurrency, args.concurrency)
+                results[name] = await run_page(
+                    handler, server, name, args.requests, args.concurrency
+                )
+    finally:
+        peak_browser_memory = await sampler.stop()
+        await handler.browser_pool.close()
+    return {
+        "timestamp": time(),
+        "commit": get_commit(),
+        "versions": {
+            "python": platform.python_version(),
+            "scrapy": scrapy.__version__,
+            "pyppeteer": pyppeteer.__version__,
+            "scrapy-pyppeteer": __version__,
+        },
+        "concurrency": args.concurrency,
+        "settings": args.settings,
+        "pages": results,
+        "memory": {
+            "browser_peak_rss": peak_browser_memory,
+            "python_peak_rss": get_python_peak_rss(),
+        },
+        "stats": {
+            key: value
+            for key, value in crawler.stats.get_stats().items()
+            if isinstance(value, (int, float))
+        },
+    }
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, universal_newlines=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_python_peak_rss() -> int:
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024  # bytes on macOS, KB on Linux
+
+
+def print_results(results: Dict, previous: Optional[Dict] = None) -> None:
+    def change(current: float, before: Optional[float]) -> str:
+        if not before:
+            return ""
+        return " ({:+.1f}%)".format((current - before) / before * 100)
+
+    for name, page in results["pages"].items():
+        before = (previous or {}).get("pages", {}).get(name, {})
+        print("{}: {} requests, {} errors".format(name, page["requests"], page["errors"]))
+        print(
+            "  throughput: {:.2f} req/s{}".format(
+                page["throughput"], change(page["throughput"], before.get("throughput"))
+            )
+        )
+        for key in ("p50", "p95", "p99"):
+            print(
+                "  latency {}: {:.3f} s{}".format(
+                    key,
+                    page["latency"][key],
+                    change(page["latency"][key], before.get("latency", {}).get(key)),
+                )
+            )
+    memory = results["memory"]["browser_peak_rss"]
+    if memory is not None:
+        before = (previous or {}).get("memory", {}).get("browser_peak_rss")
+        print("browser peak RSS: {:.1f} MB{}".format(memory / 1024 ** 2, change(memory, before)))
+
+
+def parse_setting(value: str) -> tuple:
+    name, _, raw_value = value.partition("=")
+    try:
+        return name, json.loads(raw_value)
+    except ValueError:
+        return name, raw_value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("-n", "--requests", type=int, default=100, help="requests per page")
+    parser.add_argument("-p", "--pages", nargs="+", choices=sorted(PAGES), default=sorted(PAGES))
+    parser.add_argument(
+        "-s",
+        "--setting",
+        dest="settings",
+        action="append",
+        type=parse_setting,
+        default=[],
+        help="Scrapy setting, NAME=VALUE (VALUE is decoded as JSON if possible)",
+    )
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare with the results from this JSON file")
+    args = parser.parse_args()
+    args.settings = dict(args.settings)
+
+    install_reactor("twisted.internet.asyncioreactor.AsyncioSelectorReactor")
+    results = asyncio.get_event_loop().run_until_complete(run(args))
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_results(results, previous)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
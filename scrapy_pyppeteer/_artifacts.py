@@ -0,0 +1,72 @@
+import base64
+import hashlib
+import logging
+import uuid
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple, Union
+
+from scrapy.settings import Settings
+from scrapy.statscollectors import StatsCollector
+
+from ._utils import run_in_executor, write_atomic
+
+
+logger = logging.getLogger("scrapy-pyppeteer")
+
+
+class Artifact(NamedTuple):
+    """Reference to a file written by an ArtifactStore"""
+
+    path: str
+    digest: str
+    size: int
+
+
+class ArtifactStore:
+    """
+    Local directory for the output of the "screenshot" and "pdf" page coroutines.
+    Decoding, hashing and writing are done in a thread, so the event loop is not
+    blocked and the contents are not kept in memory once written.
+
+    Files are named after the SHA-256 of their contents if "dedupe" is enabled
+    (identical artifacts are only written once), with a random name otherwise.
+    """
+
+    def __init__(self, path: str, stats: StatsCollector, dedupe: bool = False) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.stats = stats
+        self.dedupe = dedupe
+
+    @classmethod
+    def from_settings(cls, settings: Settings, stats: StatsCollector) -> Optional["ArtifactStore"]:
+        if not settings.get("PYPPETEER_ARTIFACTS_DIR"):
+            return None
+        return cls(
+            path=settings["PYPPETEER_ARTIFACTS_DIR"],
+            stats=stats,
+            dedupe=settings.getbool("PYPPETEER_ARTIFACTS_DEDUPE"),
+        )
+
+    async def save(self, data: Union[bytes, str], extension: str) -> Artifact:
+        """Store the data (raw bytes or a base64-encoded string), return a reference to it"""
+        artifact, written = await run_in_executor(self._save, data, extension)
+        self.stats.inc_value("pyppeteer/artifacts/count")
+        if written:
+            self.stats.inc_value("pyppeteer/artifacts/bytes", artifact.size)
+        else:
+            self.stats.inc_value("pyppeteer/artifacts/deduplicated")
+        logger.debug("Stored artifact %s (%i bytes)", artifact.path, artifact.size)
+        return artifact
+
+    def _save(self, data: Union[bytes, str], extension: str) -> Tuple[Artifact, bool]:
+        if isinstance(data, str):
+            data = base64.b64decode(data)
+        digest = hashlib.sha256(data).hexdigest()
+        name = digest if self.dedupe else uuid.uuid4().hex
+        path = self.path / (name + extension)
+        artifact = Artifact(path=str(path), digest=digest, size=len(data))
+        if self.dedupe and path.is_file():
+            return artifact, False
+        write_atomic(path, data)
+        return artifact, True
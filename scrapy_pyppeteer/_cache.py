@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import os
+from collections import Counter, OrderedDict
+from email.utils import mktime_tz, parsedate_tz
+from pathlib import Path
+from time import time
+from typing import Dict, List, Optional
+
+from scrapy.settings import Settings
+from scrapy.statscollectors import StatsCollector
+
+from ._utils import run_in_executor, write_atomic
+
+
+logger = logging.getLogger("scrapy-pyppeteer")
+
+
+class SubresourceCache:
+    """
+    On-disk cache for the subresources (scripts, stylesheets, images, etc)
+    requested by the browser, shared by all pages and persisted across runs.
+
+    Entries are keyed by URL and the values of the request headers listed in the
+    "Vary" response header. Bodies are stored by the SHA-256 of their contents,
+    identical bodies are only stored once. Only responses with an explicit
+    freshness lifetime (Cache-Control: max-age or Expires) are stored, and the
+    least recently used entries are removed when the total size exceeds max_size.
+    The Vary header of a URL is only kept while there are stored entries for it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        stats: StatsCollector,
+        max_size: int,
+        resource_types: Optional[List[str]] = None,
+    ) -> None:
+        self.path = Path(path)
+        self.objects_path = self.path / "objects"
+        self.objects_path.mkdir(parents=True, exist_ok=True)
+        self.stats = stats
+        self.max_size = max_size
+        self.resource_types = frozenset(resource_types) if resource_types else None
+        self.size = 0
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._vary: Dict[str, List[str]] = {}
+        self._url_counts: Counter = Counter()
+        self._refcounts: Counter = Counter()
+        self._load()
+
+    @classmethod
+    def from_settings(
+        cls, settings: Settings, stats: StatsCollector
+    ) -> Optional["SubresourceCache"]:
+        if not settings.get("PYPPETEER_CACHE_DIR"):
+            return None
+        return cls(
+            path=settings["PYPPETEER_CACHE_DIR"],
+            stats=stats,
+            max_size=settings.getint("PYPPETEER_CACHE_MAX_SIZE_MB", 100) * 1024 * 1024,
+            resource_types=settings.getlist(
+                "PYPPETEER_CACHE_RESOURCE_TYPES", ["script", "stylesheet", "image", "font"]
+            ),
+        )
+
+    def accepts(self, method: str, resource_type: str) -> bool:
+        return method == "GET" and (
+            self.resource_types is None or resource_type in self.resource_types
+        )
+
+    async def get(self, url: str, request_headers: dict) -> Optional[dict]:
+        """Return a dict with the status, headers and body of a cached response, if any"""
+        key = self._key(url, request_headers)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.inc_value("pyppeteer/cache/miss")
+            return None
+        if entry["expires"] <= time():
+            self._remove(key)
+            self.stats.inc_value("pyppeteer/cache/expired")
+            return None
+        try:
+            body = await run_in_executor(self._object_path(entry["digest"]).read_bytes)
+        except OSError:
+            self._remove(key)
+            self.stats.inc_value("pyppeteer/cache/miss")
+            return None
+        self._entries.move_to_end(key)
+        self.stats.inc_value("pyppeteer/cache/hit")
+        return {"status": entry["status"], "headers": entry["headers"], "body": body}
+
+    def should_store(self, url: str, request_headers: dict, headers: dict) -> bool:
+        """Whether a response is cacheable and not stored yet, checked before reading its body"""
+        vary = _split_header(headers.get("vary", ""))
+        if "*" in vary:
+            return False
+        expires = _get_expiration(headers)
+        if expires is None or expires <= time():
+            return False
+        return self._key(url, request_headers, vary) not in self._entries
+
+    async def put(
+        self, url: str, request_headers: dict, status: int, headers: dict, body: bytes
+    ) -> None:
+        vary = _split_header(headers.get("vary", ""))
+        expires = _get_expiration(headers)
+        if "*" in vary or expires is None or expires <= time() or len(body) > self.max_size:
+            return
+        key = self._key(url, request_headers, vary)
+        digest = hashlib.sha256(body).hexdigest()
+        if not self._refcounts[digest]:
+            await run_in_executor(write_atomic, self._object_path(digest), body)
+        if key in self._entries:
+            self._remove(key)
+        self._vary[url] = vary
+        self._entries[key] = {
+            "url": url,
+            "status": status,
+            "headers": {
+                name: value
+                for name, value in headers.items()
+                if name not in ("content-encoding", "content-length", "transfer-encoding")
+            },
+            "digest": digest,
+            "size": len(body),
+            "expires": expires,
+        }
+        self._add_reference(key, digest, len(body))
+        self.stats.inc_value("pyppeteer/cache/stored")
+        while self.size > self.max_size:
+            self._remove(next(iter(self._entries)))
+            self.stats.inc_value("pyppeteer/cache/evicted")
+
+    def close(self) -> None:
+        index = {"entries": list(self._entries.items()), "vary": self._vary}
+        write_atomic(self.path / "index.json", json.dumps(index).encode("utf8"))
+
+    def _key(self, url: str, request_headers: dict, vary: Optional[List[str]] = None) -> str:
+        parts = [url]
+        for name in self._vary.get(url, ()) if vary is None else vary:
+            parts.append("{}:{}".format(name, request_headers.get(name, "")))
+        return hashlib.sha1("\n".join(parts).encode("utf8")).hexdigest()
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects_path / digest
+
+    def _add_reference(self, key: str, digest: str, size: int) -> None:
+        if not self._refcounts[digest]:
+            self.size += size
+        self._refcounts[digest] += 1
+        self._url_counts[self._entries[key]["url"]] += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        url = entry["url"]
+        self._url_counts[url] -= 1
+        if not self._url_counts[url]:
+            del self._url_counts[url]
+            self._vary.pop(url, None)
+        digest = entry["digest"]
+        self._refcounts[digest] -= 1
+        if not self._refcounts[digest]:
+            del self._refcounts[digest]
+            self.size -= entry["size"]
+            try:
+                os.remove(str(self._object_path(digest)))
+            except OSError:
+                pass
+
+    def _load(self) -> None:
+        try:
+            index = json.loads((self.path / "index.json").read_text())
+        except (OSError, ValueError):
+            index = {"entries": [], "vary": {}}
+        now = time()
+        for key, entry in index["entries"]:
+            if entry["expires"] > now and self._object_path(entry["digest"]).is_file():
+                self._entries[key] = entry
+                self._add_reference(key, entry["digest"], entry["size"])
+        # only keep the Vary headers of the URLs which still have entries
+        self._vary = {url: vary for url, vary in index["vary"].items() if url in self._url_counts}
+        # remove bodies which are not referenced by any entry
+        for path in self.objects_path.iterdir():
+            if path.name not in self._refcounts:
+                path.unlink()
+        logger.info("Loaded %i cached subresources from %s", len(self._entries), self.path)
+
+
+def _split_header(value: str) -> List[str]:
+    return [part.strip().lower() for part in value.split(",") if part.strip()]
+
+
+def _get_expiration(headers: dict) -> Optional[float]:
+    """Absolute expiration timestamp according to the Cache-Control or Expires headers"""
+    directives = {}
+    for directive in _split_header(headers.get("cache-control", "")):
+        name, _, value = directive.partition("=")
+        directives[name.strip()] = value.strip().strip('"')
+    if {"no-store", "no-cache", "private"}.intersection(directives):
+        return None
+    try:
+        age = int(headers.get("age", 0))
+    except ValueError:
+        age = 0
+    if "max-age" in directives:
+        try:
+            return time() + int(directives["max-age"]) - age
+        except ValueError:
+            return None
+    if headers.get("expires"):
+        expires = parsedate_tz(headers["expires"])
+        if expires is None:
+            return None
+        date = parsedate_tz(headers.get("date", ""))
+        now = mktime_tz(date) if date else time()
+        return time() + mktime_tz(expires) - now
+    return None
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import logging
+import re
+import weakref
+from typing import TYPE_CHECKING, Any, List, Optional, Pattern, Set
+
+from scrapy.statscollectors import StatsCollector
+
+if TYPE_CHECKING:
+    from pyppeteer.network_manager import Response as PyppeteerResponse
+
+
+logger = logging.getLogger("scrapy-pyppeteer")
+
+
+class CapturedResponse:
+    """Body and metadata of a response received by the page, captured during rendering"""
+
+    __slots__ = ("url", "status", "headers", "body", "__weakref__")
+
+    def __init__(self, url: str, status: int, headers: dict, body: bytes) -> None:
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+    def __repr__(self) -> str:
+        return "<%s %i %s (%i bytes)>" % (
+            self.__class__.__name__,
+            self.status,
+            self.url,
+            len(self.body),
+        )
+
+
+class CaptureBudget:
+    """
+    Amount of captured bytes alive across all requests. Bytes are returned to the budget
+    when the corresponding CapturedResponse objects are garbage collected.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None) -> None:
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    def reserve(self, size: int) -> bool:
+        if self.max_bytes is not None and self.used + size > self.max_bytes:
+            return False
+        self.used += size
+        return True
+
+    def track(self, captured: CapturedResponse) -> None:
+        finalizer = weakref.finalize(captured, self._release, len(captured.body))
+        finalizer.atexit = False
+
+    def _release(self, size: int) -> None:
+        self.used -= size
+
+
+class ResponseCapture:
+    """
+    Collect the bodies of the responses received by a page whose URL matches the given
+    regular expression and whose resource type is one of "resource_types" (all if empty).
+    Responses which would make the captured size of the request exceed "max_bytes",
+    or the captured size of all requests exceed the budget, are skipped.
+    """
+
+    def __init__(
+        self,
+        pattern: Pattern,
+        stats: StatsCollector,
+        budget: CaptureBudget,
+        resource_types: Optional[List[str]] = None,
+        max_bytes: Optional[int] = None,
+    ) -> None:
+        self.pattern = pattern
+        self.stats = stats
+        self.budget = budget
+        self.resource_types = frozenset(resource_types) if resource_types else None
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.responses: List[CapturedResponse] = []
+        self._pending: Set[asyncio.Future] = set()
+
+    @classmethod
+    def from_patterns(cls, patterns: Any, **kwargs) -> "ResponseCapture":
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        return cls(pattern=re.compile("|".join(patterns)), **kwargs)
+
+    def on_response(self, response: "PyppeteerResponse") -> None:
+        """Listener for the "response" event of the page"""
+        resource_type = response.request.resourceType
+        if self.resource_types is not None and resource_type not in self.resource_types:
+            return
+        if not self.pattern.search(response.url):
+            return
+        try:
+            length = int(response.headers.get("content-length", 0))
+        except ValueError:
+            length = 0
+        if not self._fits(length):
+            self.stats.inc_value("pyppeteer/capture/skipped")
+            return
+        task = asyncio.ensure_future(self._capture(response))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def finish(self, timeout: Optional[float] = None) -> List[CapturedResponse]:
+        """Wait for the bodies which are still being read, return the captured responses"""
+        if self._pending:
+            _, pending = await asyncio.wait(set(self._pending), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                self.stats.inc_value("pyppeteer/capture/incomplete", len(pending))
+        return self.responses
+
+    def _fits(self, size: int) -> bool:
+        if self.max_bytes is not None and self.size + size > self.max_bytes:
+            return False
+        budget = self.budget.max_bytes
+        return budget is None or self.budget.used + size <= budget
+
+    async def _capture(self, response: "PyppeteerResponse") -> None:
+        try:
+            body = await response.buffer()
+        except Exception as exc:
+            logger.debug("Could not get the body of %s to capture it: %r", response.url, exc)
+            return
+        if not self._fits(len(body)) or not self.budget.reserve(len(body)):
+            self.stats.inc_value("pyppeteer/capture/skipped")
+            return
+        self.size += len(body)
+        captured = CapturedResponse(
+            url=response.url, status=response.status, headers=response.headers, body=body
+        )
+        self.budget.track(captured)
+        self.responses.append(captured)
+        self.stats.inc_value("pyppeteer/capture/count")
+        self.stats.inc_value("pyppeteer/capture/bytes", len(body))
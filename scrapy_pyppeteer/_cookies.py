@@ -0,0 +1,125 @@
+import weakref
+from http.cookiejar import Cookie
+from typing import TYPE_CHECKING, Dict, Iterator, List, MutableMapping, Optional, Tuple
+
+from scrapy.http.cookies import CookieJar
+from scrapy.statscollectors import StatsCollector
+
+if TYPE_CHECKING:
+    from pyppeteer.page import Page
+
+
+CookieKey = Tuple[str, str, str]  # domain, path, name
+KnownCookies = Dict[CookieKey, Optional[str]]  # values known to be in a browser context
+
+
+class CookieSync:
+    """
+    Keep the cookies of Scrapy's cookiejars and the browser in sync: before navigating,
+    pages are seeded with the cookies from the jar which apply to the domain of the request,
+    and after rendering the cookies of the page are written back into the jar.
+
+    Browser contexts keep their cookies across pages, so the values known to be in each
+    context are tracked: only cookies which changed since the last sync are sent to the
+    browser or written into the jar.
+    """
+
+    def __init__(self, stats: StatsCollector) -> None:
+        self.stats = stats
+        self._known: MutableMapping[object, KnownCookies] = weakref.WeakKeyDictionary()
+
+    async def seed(self, page: "Page", jar: CookieJar, host: str) -> None:
+        known = self._get_known(page)
+        cookies = []
+        for cookie in _cookies_for_host(jar, host):
+            key = (cookie.domain, cookie.path, cookie.name)
+            if (
+                known.get(key) != cookie.value
+                and cookie.value is not None
+                and not cookie.is_expired()
+            ):
+                cookies.append(cookie)
+        if cookies:
+            await page.setCookie(*[_to_browser(cookie) for cookie in cookies])
+            for cookie in cookies:
+                known[cookie.domain, cookie.path, cookie.name] = cookie.value
+            self.stats.inc_value("pyppeteer/cookies/seeded", len(cookies))
+
+    async def harvest(self, page: "Page", jar: CookieJar, urls: List[str]) -> None:
+        known = self._get_known(page)
+        count = 0
+        for cookie in await page.cookies(*urls):
+            key = (cookie["domain"], cookie["path"], cookie["name"])
+            if known.get(key) != cookie["value"]:
+                jar.set_cookie(_from_browser(cookie))
+                known[key] = cookie["value"]
+                count += 1
+        if count:
+            self.stats.inc_value("pyppeteer/cookies/harvested", count)
+
+    def _get_known(self, page: "Page") -> KnownCookies:
+        context = page.target.browserContext
+        try:
+            return self._known[context]
+        except KeyError:
+            known = self._known[context] = {}
+            return known
+
+
+def _cookies_for_host(jar: CookieJar, host: str) -> Iterator[Cookie]:
+    """
+    Cookies which apply to a host: host-only cookies for the host itself and domain
+    cookies for the host or its parent domains. Only the domains which can match are
+    looked up, instead of going through all the cookies in the jar.
+    """
+    domains = [host]
+    labels = host.split(".")
+    domains.extend("." + ".".join(labels[i:]) for i in range(len(labels)))
+    cookies_by_domain = jar.jar._cookies
+    for domain in domains:
+        for cookies_by_name in cookies_by_domain.get(domain, {}).values():
+            yield from cookies_by_name.values()
+
+
+def _to_browser(cookie: Cookie) -> dict:
+    """http.cookiejar.Cookie to the format expected by pyppeteer.page.Page.setCookie"""
+    result: dict = {
+        "name": cookie.name,
+        "value": cookie.value,
+        "path": cookie.path,
+        "secure": cookie.secure,
+        "httpOnly": cookie.has_nonstandard_attr("HttpOnly"),
+    }
+    if cookie.domain.startswith("."):
+        result["domain"] = cookie.domain
+    else:
+        # host-only cookie, the browser would make it a domain cookie if given a domain
+        scheme = "https" if cookie.secure else "http"
+        result["url"] = "{}://{}{}".format(scheme, cookie.domain, cookie.path)
+    if cookie.expires is not None:
+        result["expires"] = cookie.expires
+    return result
+
+
+def _from_browser(cookie: dict) -> Cookie:
+    """Cookie from pyppeteer.page.Page.cookies to http.cookiejar.Cookie"""
+    domain = cookie["domain"]
+    session = cookie.get("session", cookie.get("expires", -1) < 0)
+    return Cookie(
+        version=0,
+        name=cookie["name"],
+        value=cookie["value"],
+        port=None,
+        port_specified=False,
+        domain=domain,
+        domain_specified=domain.startswith("."),
+        domain_initial_dot=domain.startswith("."),
+        path=cookie["path"],
+        path_specified=True,
+        secure=cookie.get("secure", False),
+        expires=None if session else int(cookie["expires"]),
+        discard=session,
+        comment=None,
+        comment_url=None,
+        rest={"HttpOnly": ""} if cookie.get("httpOnly") else {},
+    )
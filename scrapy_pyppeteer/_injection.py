@@ -0,0 +1,96 @@
+import logging
+import weakref
+from typing import TYPE_CHECKING, Any, Callable, Dict, MutableMapping, Optional
+
+if TYPE_CHECKING:
+    from pyppeteer.network_manager import Response as PyppeteerResponse
+    from pyppeteer.page import Page
+
+
+logger = logging.getLogger("scrapy-pyppeteer")
+
+
+# qualified name of the annotation -> object to be injected
+INJECTABLE_TYPES = {
+    "pyppeteer.page.Page": "page",
+    "pyppeteer.connection.CDPSession": "cdp_session",
+    "pyppeteer.browser.BrowserContext": "context",
+    "pyppeteer.browser.Browser": "browser",
+    "pyppeteer.network_manager.Response": "response",
+}
+
+# objects which are only usable while the page is open
+PAGE_BOUND = frozenset(["page", "cdp_session"])
+
+
+class InjectionPlan:
+    """
+    Callback arguments to be filled with browser objects, according to their annotations:
+    the Page, a CDPSession attached to it, its BrowserContext, its Browser, or the
+    pyppeteer Response of the main navigation (for headers, timing, remote address, etc).
+    Arguments which need the page to stay open (the page and the CDP session)
+    are handled by the spider, which is expected to close the page.
+    """
+
+    def __init__(self, arguments: Optional[Dict[str, str]] = None) -> None:
+        self.arguments = arguments or {}
+        self.needs_page = any(kind in PAGE_BOUND for kind in self.arguments.values())
+
+    def __bool__(self) -> bool:
+        return bool(self.arguments)
+
+    async def inject(
+        self, cb_kwargs: dict, page: "Page", response: Optional["PyppeteerResponse"]
+    ) -> None:
+        for name, kind in self.arguments.items():
+            if kind == "page":
+                cb_kwargs[name] = page
+            elif kind == "cdp_session":
+                cb_kwargs[name] = await page.target.createCDPSession()
+            elif kind == "context":
+                cb_kwargs[name] = page.target.browserContext
+            elif kind == "browser":
+                cb_kwargs[name] = page.browser
+            elif kind == "response":
+                cb_kwargs[name] = response
+
+
+NO_INJECTION = InjectionPlan()
+
+_plans: MutableMapping[Callable, InjectionPlan] = weakref.WeakKeyDictionary()
+
+
+def get_injection_plan(callback: Callable) -> InjectionPlan:
+    """Return the InjectionPlan for the callback, computed once per function"""
+    # bound methods are created on each attribute access, use the underlying function
+    function = getattr(callback, "__func__", callback)
+    try:
+        return _plans[function]
+    except KeyError:
+        pass
+    except TypeError:  # not weak-referenceable
+        return _build_plan(function)
+    plan = _plans[function] = _build_plan(function)
+    return plan
+
+
+def _build_plan(function: Callable) -> InjectionPlan:
+    arguments = {}
+    for name, annotation in getattr(function, "__annotations__", {}).items():
+        kind = INJECTABLE_TYPES.get(_qualified_name(annotation))
+        if kind is not None and name != "return":
+            arguments[name] = kind
+    if arguments:
+        logger.debug("Injecting %r into the arguments of %r", arguments, function)
+        return InjectionPlan(arguments)
+    return NO_INJECTION
+
+
+def _qualified_name(annotation: Any) -> str:
+    # string annotations (i.e. "from __future__ import annotations")
+    # are only recognized if they are fully qualified
+    if isinstance(annotation, str):
+        return annotation
+    module = getattr(annotation, "__module__", None)
+    name = getattr(annotation, "__qualname__", None)
+    return "{}.{}".format(module, name) if module and name else ""
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import weakref
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+
+from scrapy.http import Response
+from scrapy.statscollectors import StatsCollector
+
+if TYPE_CHECKING:
+    from pyppeteer.page import Page
+
+
+logger = logging.getLogger("scrapy-pyppeteer")
+
+
+class PageLeases:
+    """
+    Track the pages injected into callbacks, which are expected to be closed by the spider.
+    A page is closed automatically if it is still open when its response is garbage
+    collected (i.e. the callback finished without closing it), or when it has been
+    open for longer than "timeout" seconds.
+
+    The on_release function passed to "add" is called when the lease ends, even if
+    the page could not be closed (e.g. because the browser crashed).
+
+    If max_pages is set, requests for callbacks which receive the page need to reserve
+    a slot before getting a page, and wait while there are max_pages outstanding pages.
+    """
+
+    def __init__(
+        self,
+        stats: StatsCollector,
+        timeout: Optional[float] = None,
+        max_pages: Optional[int] = None,
+    ) -> None:
+        self.stats = stats
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self._semaphore = asyncio.Semaphore(max_pages) if max_pages else None
+        self._leases: Dict[
+            "Page", Tuple[Optional[asyncio.Handle], weakref.finalize, Optional[Callable]]
+        ] = {}
+
+    def __len__(self) -> int:
+        return len(self._leases)
+
+    async def reserve(self) -> None:
+        if self._semaphore is None:
+            return
+        if self._semaphore.locked():
+            self.stats.inc_value("pyppeteer/injected_page/wait_count")
+        await self._semaphore.acquire()
+
+    def cancel_reservation(self) -> None:
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    def add(
+        self, page: "Page", response: Response, on_release: Optional[Callable[[], None]] = None
+    ) -> None:
+        """Start the lease of a page, a reservation must have been made before"""
+        loop = asyncio.get_event_loop()
+        expiration = None
+        if self.timeout is not None:
+            expiration = loop.call_later(self.timeout, self._expire, page)
+        finalizer = weakref.finalize(response, self._leaked, loop, page)
+        finalizer.atexit = False
+        self._leases[page] = (expiration, finalizer, on_release)
+        page.once("close", partial(self._release, page))
+        self.stats.max_value("pyppeteer/injected_page/outstanding_max", len(self._leases))
+
+    async def close(self) -> None:
+        for page in list(self._leases):
+            await self._close(page)
+
+    def _release(self, page: "Page") -> None:
+        lease = self._leases.pop(page, None)
+        if lease is None:
+            return
+        expiration, finalizer, on_release = lease
+        if expiration is not None:
+            expiration.cancel()
+        finalizer.detach()
+        self.cancel_reservation()
+        if on_release is not None:
+            on_release()
+
+    def _expire(self, page: "Page") -> None:
+        if page in self._leases:
+            self.stats.inc_value("pyppeteer/injected_page/expired")
+            logger.warning("Closing page %s, injected %.1f seconds ago", page.url, self.timeout)
+            self._close_soon(page)
+
+    def _leaked(self, loop: asyncio.AbstractEventLoop, page: "Page") -> None:
+        # called by the garbage collector, which could run at any time
+        if page in self._leases and not loop.is_closed():
+            self.stats.inc_value("pyppeteer/injected_page/leaked")
+            loop.call_soon_threadsafe(self._close_soon, page)
+
+    def _close_soon(self, page: "Page") -> None:
+        if page in self._leases:
+            asyncio.ensure_future(self._close(page))
+
+    async def _close(self, page: "Page") -> None:
+        try:
+            await page.close()
+        except Exception as exc:
+            logger.debug("Error closing injected page %s: %r", page.url, exc)
+        self._release(page)  # the "close" event is not emitted if the page is gone already
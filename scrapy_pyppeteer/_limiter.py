@@ -0,0 +1,93 @@
+import asyncio
+from collections import defaultdict, deque
+from time import monotonic
+from typing import Deque, DefaultDict, Optional, Tuple
+
+from scrapy.statscollectors import StatsCollector
+
+
+class PageLimiter:
+    """
+    Limit the amount of pages in use, globally and per domain.
+
+    Requests wait in a single FIFO queue: when a slot is freed, it goes to the
+    oldest waiting request which is allowed to run, so a domain at its limit
+    does not block the requests for other domains queued behind it.
+    """
+
+    def __init__(
+        self,
+        stats: StatsCollector,
+        max_pages: Optional[int] = None,
+        max_pages_per_domain: Optional[int] = None,
+    ) -> None:
+        self.stats = stats
+        self.max_pages = max_pages
+        self.max_pages_per_domain = max_pages_per_domain
+        self.active = 0
+        self._active_per_domain: DefaultDict[str, int] = defaultdict(int)
+        self._waiters: Deque[Tuple[str, asyncio.Future]] = deque()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_pages or self.max_pages_per_domain)
+
+    def __len__(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, domain: str) -> None:
+        if self._can_run(domain):
+            self._take(domain)
+            return
+
+        waiter = (domain, asyncio.get_event_loop().create_future())
+        self._waiters.append(waiter)
+        self.stats.inc_value("pyppeteer/page_limiter/wait_count")
+        self.stats.max_value("pyppeteer/page_limiter/queue_depth_max", len(self._waiters))
+        start_time = monotonic()
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif not waiter[1].cancelled():
+                self.release(domain)  # the slot was handed over right before cancelling
+            raise
+        wait_time = monotonic() - start_time
+        self.stats.inc_value("pyppeteer/page_limiter/wait_time", wait_time)
+        self.stats.max_value("pyppeteer/page_limiter/wait_time_max", wait_time)
+
+    def release(self, domain: str) -> None:
+        if not self.enabled:
+            return
+        self.active -= 1
+        self._active_per_domain[domain] -= 1
+        if not self._active_per_domain[domain]:
+            del self._active_per_domain[domain]
+        self._wake_waiters()
+
+    def _can_run(self, domain: str) -> bool:
+        if self.max_pages and self.active >= self.max_pages:
+            return False
+        if self.max_pages_per_domain and (
+            self._active_per_domain.get(domain, 0) >= self.max_pages_per_domain
+        ):
+            return False
+        return True
+
+    def _take(self, domain: str) -> None:
+        if self.enabled:
+            self.active += 1
+            self._active_per_domain[domain] += 1
+
+    def _wake_waiters(self) -> None:
+        for waiter in list(self._waiters):
+            if self.max_pages and self.active >= self.max_pages:
+                break
+            domain, future = waiter
+            if future.done():
+                self._waiters.remove(waiter)
+            elif self._can_run(domain):
+                self._waiters.remove(waiter)
+                self._take(domain)
+                future.set_result(None)
@@ -1,10 +1,27 @@
+import asyncio
+
+
+_patched = False
+
+
 def _patch_pyppeteer_connection():
     """
     Prevent Chromium from disconnecting after 20 seconds
 
     Taken from https://github.com/miyakogi/pyppeteer/pull/160#issuecomment-571711413
+
+    Also ignore the responses to protocol calls which were cancelled (i.e. when the
+    request deadline expires): pyppeteer would try to set the result of the cancelled
+    future, and the InvalidStateError would stop the connection or the session.
+    Cancelled calls are skipped as well when the connection or the session is closed,
+    otherwise the remaining calls would never be rejected.
     """
 
+    global _patched
+    if _patched:
+        return
+    _patched = True
+
     import pyppeteer
     import websockets.client
 
@@ -21,5 +38,37 @@ def _patch_pyppeteer_connection():
                 ping_timeout=None,
             )
 
+        def _on_response(self, msg):
+            try:
+                super()._on_response(msg)
+            except asyncio.InvalidStateError:
+                pass
+
+        async def _on_close(self):
+            _drop_done_callbacks(self._callbacks)
+            await super()._on_close()
+
+    # patched in place instead of replaced by a subclass: the qualified name of the
+    # class is used to recognize the arguments to inject into callbacks
+    cdp_session_on_message = pyppeteer.connection.CDPSession._on_message
+    cdp_session_on_closed = pyppeteer.connection.CDPSession._on_closed
+
+    def _on_message(self, msg):
+        try:
+            cdp_session_on_message(self, msg)
+        except asyncio.InvalidStateError:
+            pass
+
+    def _on_closed(self):
+        _drop_done_callbacks(self._callbacks)
+        cdp_session_on_closed(self)
+
+    pyppeteer.connection.CDPSession._on_message = _on_message
+    pyppeteer.connection.CDPSession._on_closed = _on_closed
     pyppeteer.connection.Connection = PatchedConnection
     pyppeteer.launcher.Connection = PatchedConnection
+
+
+def _drop_done_callbacks(callbacks: dict) -> None:
+    for call_id in [call_id for call_id, future in callbacks.items() if future.done()]:
+        del callbacks[call_id]
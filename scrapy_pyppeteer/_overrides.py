@@ -0,0 +1,78 @@
+from typing import Awaitable, Callable, Dict, Optional
+
+from scrapy.http import Request, Response
+from scrapy.http.headers import Headers
+
+
+class RequestOverrides:
+    """
+    Interception payloads for the requests made by the page of a Scrapy request,
+    computed once per download and shared by all the interception events (do not modify).
+
+    The main request gets the method, headers and body from the Scrapy request. Headers
+    with multiple values are joined according to RFC 7230 (with "; " for cookies).
+    Pyppeteer can only override the request body with text, which Chromium encodes
+    as UTF-8: bodies which are not valid UTF-8 are downloaded by "fetch" instead
+    (the regular Scrapy download handler) and the response is given to the browser.
+    Subresource requests get the User-Agent header from the Scrapy request, if any.
+    """
+
+    __slots__ = ("url", "main", "user_agent", "fetch")
+
+    def __init__(
+        self,
+        request: Request,
+        fetch: Optional[Callable[[], Awaitable[Response]]] = None,
+    ) -> None:
+        self.url = request.url
+        headers = {
+            _decode(name).lower(): _join_values(name, values)
+            for name, values in request.headers.items()
+        }
+        self.main: dict = {"method": request.method, "headers": headers}
+        self.fetch = None
+        if request.body:
+            try:
+                self.main["postData"] = request.body.decode("utf-8")
+            except UnicodeDecodeError:
+                self.fetch = fetch
+        self.user_agent: Optional[str] = headers.get("user-agent")
+
+    def subresource(self, headers: Dict[str, str]) -> Optional[dict]:
+        if self.user_agent is None:
+            return None
+        headers = headers.copy()
+        headers["user-agent"] = self.user_agent
+        return {"headers": headers}
+
+
+def response_to_dict(response: Response) -> dict:
+    """Scrapy response in the format expected by pyppeteer.network_manager.Request.respond"""
+    headers = Headers(response.headers)
+    for name in ("Content-Length", "Transfer-Encoding"):
+        headers.pop(name, None)
+    set_cookie = headers.pop("Set-Cookie", None)
+    result = {
+        "status": response.status,
+        "headers": {_decode(name): _join_values(name, values) for name, values in headers.items()},
+        "body": response.body,
+    }
+    if set_cookie:
+        # cookies cannot be joined in a single header, pyppeteer writes the headers
+        # one per line in the raw response so they can be split into several lines
+        values = [_decode(value) for value in set_cookie]
+        result["headers"]["set-cookie"] = "\r\nset-cookie: ".join(values)
+    return result
+
+
+def _decode(value: bytes) -> str:
+    # Chromium encodes the strings it receives as UTF-8
+    try:
+        return value.decode("utf-8")
+    except UnicodeDecodeError:
+        return value.decode("latin-1")
+
+
+def _join_values(name: bytes, values: list) -> str:
+    separator = "; " if name.lower() == b"cookie" else ", "
+    return separator.join(_decode(value) for value in values)
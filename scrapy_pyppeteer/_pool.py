@@ -0,0 +1,595 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from functools import partial
+from time import monotonic
+from types import ModuleType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from scrapy.statscollectors import StatsCollector
+
+from .exceptions import BrowserDisconnectedError
+
+if TYPE_CHECKING:
+    from pyppeteer.browser import Browser, BrowserContext
+    from pyppeteer.page import Page
+
+
+logger = logging.getLogger("scrapy-pyppeteer")
+
+
+class PagePool:
+    """
+    Bounded pool of warm pages, reused across requests instead of opening
+    and closing a browser tab for each one of them.
+
+    Pages are reset before going back to the pool: listeners are dropped and
+    the page is navigated to "about:blank". Other state (viewport, extra headers,
+    user agent, scripts to evaluate on new documents, exposed functions, etc)
+    is kept, pages whose state was changed must be closed instead of released.
+    Pages which stay idle for longer than idle_timeout seconds are closed
+    the next time the pool is accessed.
+    """
+
+    def __init__(
+        self,
+        create_page: Callable[[], Awaitable["Page"]],
+        stats: StatsCollector,
+        size: int,
+        idle_timeout: Optional[float] = None,
+    ) -> None:
+        self.create_page = create_page
+        self.stats = stats
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._idle: Deque[Tuple["Page", float]] = deque()
+
+    def __len__(self) -> int:
+        return len(self._idle)
+
+    async def fill(self) -> None:
+        """Pre-create pages until the pool is full"""
+        while len(self._idle) < self.size:
+            self._idle.append((await self.create_page(), monotonic()))
+
+    async def acquire(self) -> "Page":
+        await self._evict_idle()
+        while self._idle:
+            # LIFO: keep the most recently used pages warm, let the others expire
+            page, _ = self._idle.pop()
+            if not page.isClosed():
+                self.stats.inc_value("pyppeteer/page_pool/hit")
+                return page
+        self.stats.inc_value("pyppeteer/page_pool/miss")
+        return await self.create_page()
+
+    async def release(self, page: "Page") -> None:
+        if page.isClosed():
+            return
+        if len(self._idle) >= self.size:
+            await self._close_page(page)
+            return
+        try:
+            await self._reset_page(page)
+        except Exception as exc:
+            logger.debug("Could not reset page %r, closing it: %r", page, exc)
+            await self._close_page(page)
+        else:
+            self._idle.append((page, monotonic()))
+            self.stats.inc_value("pyppeteer/page_pool/recycled")
+
+    async def close(self) -> None:
+        while self._idle:
+            page, _ = self._idle.popleft()
+            await self._close_page(page)
+
+    async def _reset_page(self, page: "Page") -> None:
+        page.remove_all_listeners()
+        await page.goto("about:blank")
+
+    async def _evict_idle(self) -> None:
+        if self.idle_timeout is None:
+            return
+        now = monotonic()
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            page, _ = self._idle.popleft()
+            await self._close_page(page)
+            self.stats.inc_value("pyppeteer/page_pool/evicted")
+
+    async def _close_page(self, page: "Page") -> None:
+        if not page.isClosed():
+            await page.close()
+            self.stats.inc_value("pyppeteer/page_count/closed")
+
+
+class _BrowserSlot:
+    def __init__(self, index: int, browser: "Browser", page_pool: Optional[PagePool]) -> None:
+        self.index = index
+        self.browser = browser
+        self.page_pool = page_pool
+        self.active = 0  # pages currently in use
+        self.page_count = 0  # pages handed out since the browser was launched
+        self.restarting = False
+        self.restart: Optional[asyncio.Future] = None
+        self.retired = False
+        self.closing = False
+        self.disconnected = False
+        self.relaunch: Optional[asyncio.Future] = None
+        self.memory_checked_at = monotonic()
+
+
+class _ContextSlot:
+    def __init__(self, name: str, context: "BrowserContext", slot: _BrowserSlot) -> None:
+        self.name = name
+        self.context = context
+        self.slot = slot
+        self.active = 0  # pages currently in use
+        self.last_used = monotonic()
+
+
+class BrowserPool:
+    """
+    Pool of browser processes. Pages are created on the browser with the least
+    amount of pages in use (ties are broken by the amount of pages handed out),
+    or on each browser in turn if strategy is "round_robin".
+
+    The launch callable receives the index of the browser. For remote browsers
+    (obtained with pyppeteer.connect) the pool disconnects from them instead of
+    closing them. If health_check_interval is set, the browsers are periodically
+    asked for their version, unresponsive ones are handled as disconnected and
+    failed relaunches (i.e. reconnections) are retried.
+
+    Browsers are replaced after handing out max_pages pages, or after their process
+    tree uses more than max_memory bytes (requires psutil). The replacement is launched
+    in the background, the current browser keeps serving pages until it is ready.
+    Retired browsers are closed once all of their pages have been released.
+
+    Browsers which disconnect unexpectedly (i.e. crash) are relaunched in the
+    background, operations on their pages fail with BrowserDisconnectedError.
+
+    Pages can also be created on named incognito browser contexts, which are
+    created on demand and closed after being idle for context_idle_timeout seconds.
+    When max_contexts is reached, the least recently used idle context is closed
+    to make room for a new one, or the request waits until one becomes idle.
+    Pages on incognito contexts are never pooled.
+    """
+
+    memory_check_interval = 10  # seconds
+
+    def __init__(
+        self,
+        launch: Callable[[int], Awaitable["Browser"]],
+        create_page: Callable[[Union["Browser", "BrowserContext"]], Awaitable["Page"]],
+        stats: StatsCollector,
+        size: int = 1,
+        page_pool_size: int = 0,
+        page_pool_idle_timeout: Optional[float] = None,
+        max_pages: Optional[int] = None,
+        max_memory: Optional[int] = None,
+        max_contexts: Optional[int] = None,
+        context_idle_timeout: Optional[float] = None,
+        strategy: str = "least_loaded",
+        remote: bool = False,
+        health_check_interval: Optional[float] = None,
+        health_check_timeout: float = 10,
+    ) -> None:
+        if strategy not in ("least_loaded", "round_robin"):
+            raise ValueError("Invalid browser selection strategy: %r" % strategy)
+        self.launch = launch
+        self.create_page = create_page
+        self.stats = stats
+        self.size = size
+        self.page_pool_size = page_pool_size
+        self.page_pool_idle_timeout = page_pool_idle_timeout
+        self.max_pages = max_pages
+        self.max_memory = max_memory
+        self.max_contexts = max_contexts
+        self.context_idle_timeout = context_idle_timeout
+        self.strategy = strategy
+        self.remote = remote
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self._slots: List[_BrowserSlot] = []
+        self._page_slots: Dict["Page", _BrowserSlot] = {}
+        self._contexts: "OrderedDict[str, _ContextSlot]" = OrderedDict()
+        self._creating_contexts: Dict[str, asyncio.Future] = {}
+        self._page_contexts: Dict["Page", _ContextSlot] = {}
+        self._context_released = asyncio.Event()
+        self._starting: Optional[asyncio.Future] = None
+        self._health_check: Optional[asyncio.Future] = None
+        self._round_robin_count = 0
+        self._closed = False
+        self._psutil = _import_psutil() if self.max_memory else None
+        if self.max_memory and self._psutil is None:
+            logger.warning("psutil is not installed, browser memory usage will not be checked")
+
+    @property
+    def browsers(self) -> List["Browser"]:
+        return [slot.browser for slot in self._slots]
+
+    @property
+    def started(self) -> bool:
+        return bool(self._slots)
+
+    async def start(self) -> None:
+        """Launch the browsers. Concurrent calls wait for the same launch"""
+        if self._closed:
+            raise RuntimeError("Browser pool is closed")
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self._start())
+        try:
+            await asyncio.shield(self._starting)
+        except Exception:
+            self._starting = None  # allow the next call to try again
+            raise
+
+    async def _start(self) -> None:
+        slots: List[_BrowserSlot] = []
+        try:
+            for index in range(self.size):
+                slots.append(await self._launch_slot(index))
+        except Exception:
+            for slot in slots:
+                await self._close_slot(slot)
+            raise
+        self._slots = slots
+        if self.health_check_interval:
+            self._health_check = asyncio.ensure_future(
+                self._health_check_loop(self.health_check_interval)
+            )
+
+    async def acquire(self, context: Optional[str] = None) -> "Page":
+        """Create a page, on the named incognito context if given (creating it if needed)"""
+        if not self.started:
+            await self.start()
+        context_slot = None
+        if context is not None:
+            context_slot = await self._get_context(context)
+            slot = context_slot.slot
+            context_slot.active += 1
+        else:
+            slot = await self._get_slot()
+        slot.active += 1
+        slot.page_count += 1
+        self.stats.inc_value("pyppeteer/browser/{}/page_count".format(slot.index))
+        try:
+            if context_slot is not None:
+                page = await self.create_page(context_slot.context)
+            elif slot.page_pool is not None:
+                page = await slot.page_pool.acquire()
+            else:
+                page = await self.create_page(slot.browser)
+        except Exception as exc:
+            if context_slot is not None:
+                self._release_context(context_slot)
+            await self._decrease_active(slot)
+            if slot.disconnected:
+                raise BrowserDisconnectedError("Browser disconnected creating a page") from exc
+            raise
+        self._page_slots[page] = slot
+        if context_slot is not None:
+            self._page_contexts[page] = context_slot
+        return page
+
+    def is_disconnected(self, page: "Page") -> bool:
+        """Whether the browser which owns the page has disconnected unexpectedly"""
+        slot = self._page_slots.get(page)
+        return slot is not None and slot.disconnected
+
+    async def release(self, page: "Page", reuse: bool = True) -> None:
+        """Return the page to its browser's page pool (if possible), close it otherwise"""
+        slot = self._page_slots.pop(page, None)
+        context_slot = self._page_contexts.pop(page, None)
+        if context_slot is not None:
+            self._release_context(context_slot)
+            reuse = False
+        if slot is not None and slot.disconnected:
+            pass  # the page is gone along with its browser
+        elif reuse and slot is not None and slot.page_pool is not None and not slot.retired:
+            await slot.page_pool.release(page)
+        elif not page.isClosed():
+            await page.close()
+            self.stats.inc_value("pyppeteer/page_count/closed")
+        if slot is not None:
+            await self._decrease_active(slot)
+
+    def detach(self, page: "Page") -> Callable[[], None]:
+        """
+        Stop managing a page which was handed out to user code.
+        It counts as active until the returned function is called.
+        """
+        slot = self._page_slots.pop(page, None)
+        context_slot = self._page_contexts.pop(page, None)
+
+        def released() -> None:
+            if context_slot is not None:
+                self._release_context(context_slot)
+            if slot is not None:
+                asyncio.ensure_future(self._decrease_active(slot))
+
+        return released
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._starting is not None and not self._starting.done():
+            await asyncio.wait([self._starting])  # close the browsers being launched
+        if self._health_check is not None:
+            self._health_check.cancel()
+        contexts, self._contexts = list(self._contexts.values()), OrderedDict()
+        for context_slot in contexts:
+            await self._close_context(context_slot)
+        slots, self._slots = self._slots, []
+        for slot in slots:
+            if slot.relaunch is not None:
+                slot.relaunch.cancel()
+            if slot.restart is not None and not slot.restart.done():
+                await asyncio.wait([slot.restart])  # close the browser being launched
+            await self._close_slot(slot)
+
+    async def _launch_slot(self, index: int) -> _BrowserSlot:
+        browser = await self.launch(index)
+        page_pool = None
+        if self.page_pool_size > 0:
+            page_pool = PagePool(
+                create_page=partial(self.create_page, browser),
+                stats=self.stats,
+                size=self.page_pool_size,
+                idle_timeout=self.page_pool_idle_timeout,
+            )
+            await page_pool.fill()
+        self.stats.inc_value("pyppeteer/browser_count")
+        slot = _BrowserSlot(index, browser, page_pool)
+        browser.on("disconnected", partial(self._browser_disconnected, slot))
+        close = browser.close
+
+        async def close_browser() -> None:
+            # closed on purpose, e.g. through ScrapyPyppeteerDownloadHandler.browser
+            slot.closing = True
+            await close()
+
+        browser.close = close_browser
+        return slot
+
+    async def _get_context(self, name: str) -> _ContextSlot:
+        await self._evict_idle_contexts()
+        context_slot = self._contexts.get(name)
+        if context_slot is not None and (
+            context_slot.slot.disconnected or context_slot.slot not in self._slots
+        ):
+            # the browser was restarted or crashed, the context is gone with it
+            del self._contexts[name]
+            if not context_slot.slot.disconnected and not context_slot.active:
+                await self._close_context(context_slot)
+            context_slot = None
+        if context_slot is None:
+            creating = self._creating_contexts.get(name)
+            if creating is not None:
+                # being created by a concurrent request, use the same one
+                await asyncio.shield(creating)
+                return await self._get_context(name)
+            creating = self._creating_contexts[name] = asyncio.get_event_loop().create_future()
+            try:
+                context_slot = await self._create_context(name)
+            finally:
+                del self._creating_contexts[name]
+                creating.set_result(None)
+        self._contexts.move_to_end(name)
+        return context_slot
+
+    async def _create_context(self, name: str) -> _ContextSlot:
+        # contexts being created count towards the limit
+        while (
+            self.max_contexts
+            and len(self._contexts) + len(self._creating_contexts) > self.max_contexts
+        ):
+            idle = [c for c in self._contexts.values() if not c.active]
+            if idle:
+                del self._contexts[idle[0].name]  # least recently used
+                await self._close_context(idle[0])
+                self.stats.inc_value("pyppeteer/context/evicted")
+            else:
+                self._context_released.clear()
+                await self._context_released.wait()
+        slot = await self._get_slot()
+        browser_context = await slot.browser.createIncognitoBrowserContext()
+        context_slot = _ContextSlot(name, browser_context, slot)
+        self._contexts[name] = context_slot
+        self.stats.inc_value("pyppeteer/context_count")
+        return context_slot
+
+    def _release_context(self, context_slot: _ContextSlot) -> None:
+        context_slot.active -= 1
+        context_slot.last_used = monotonic()
+        if not context_slot.active:
+            self._context_released.set()
+
+    async def _evict_idle_contexts(self) -> None:
+        if self.context_idle_timeout is None:
+            return
+        now = monotonic()
+        for context_slot in list(self._contexts.values()):
+            if (
+                not context_slot.active
+                and now - context_slot.last_used > self.context_idle_timeout
+                and self._contexts.get(context_slot.name) is context_slot
+            ):
+                del self._contexts[context_slot.name]
+                await self._close_context(context_slot)
+                self.stats.inc_value("pyppeteer/context/evicted")
+
+    async def _close_context(self, context_slot: _ContextSlot) -> None:
+        if context_slot.slot.disconnected:
+            return
+        try:
+            await context_slot.context.close()
+        except Exception as exc:
+            logger.debug("Error closing context %r: %r", context_slot.name, exc)
+        else:
+            self.stats.inc_value("pyppeteer/context/closed")
+
+    async def _get_slot(self) -> _BrowserSlot:
+        while True:
+            slots = [s for s in self._slots if not s.disconnected]
+            if slots:
+                if self.strategy == "round_robin":
+                    slot = slots[self._round_robin_count % len(slots)]
+                    self._round_robin_count += 1
+                else:
+                    slot = min(slots, key=lambda s: (s.active, s.page_count))
+                if self._should_restart(slot):
+                    slot.restarting = True
+                    slot.restart = asyncio.ensure_future(self._restart(slot))
+                return slot
+            # all browsers are down: wait until at least one of them is back
+            for slot in self._slots:
+                if slot.relaunch is None or slot.relaunch.done():
+                    self._start_relaunch(slot)
+            relaunches = [s.relaunch for s in self._slots if s.relaunch is not None]
+            done, _ = await asyncio.wait(relaunches, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()  # propagate launch errors
+
+    def _browser_disconnected(self, slot: _BrowserSlot) -> None:
+        if slot.closing or slot.disconnected:
+            return
+        slot.disconnected = True
+        self.stats.inc_value("pyppeteer/browser_crash_count")
+        self.stats.inc_value("pyppeteer/browser/{}/crash_count".format(slot.index))
+        if slot in self._slots:
+            logger.warning("Browser %i disconnected unexpectedly, relaunching", slot.index)
+            self._start_relaunch(slot)
+        else:  # retired browser
+            asyncio.ensure_future(self._close_slot(slot))
+
+    def _start_relaunch(self, slot: _BrowserSlot) -> None:
+        slot.relaunch = asyncio.ensure_future(self._relaunch(slot))
+        # avoid "exception was never retrieved" warnings, errors are also raised in _get_slot
+        slot.relaunch.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def _relaunch(self, slot: _BrowserSlot) -> None:
+        try:
+            new_slot = await self._launch_slot(slot.index)
+        except Exception:
+            logger.exception("Could not relaunch browser %i", slot.index)
+            raise
+        if slot in self._slots:
+            self._slots[self._slots.index(slot)] = new_slot
+            self.stats.inc_value("pyppeteer/browser_relaunch_count")
+        else:  # the pool was closed in the meantime
+            await self._close_slot(new_slot)
+        await self._close_slot(slot)
+
+    async def _health_check_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            for slot in list(self._slots):
+                if slot.disconnected:
+                    if slot.relaunch is None or slot.relaunch.done():
+                        self._start_relaunch(slot)  # the previous attempt failed
+                elif not await self._is_healthy(slot) and not slot.disconnected:
+                    self.stats.inc_value(
+                        "pyppeteer/browser/{}/health_check_failed".format(slot.index)
+                    )
+                    logger.warning("Browser %i failed a health check", slot.index)
+                    self._browser_disconnected(slot)
+
+    async def _is_healthy(self, slot: _BrowserSlot) -> bool:
+        try:
+            await asyncio.wait_for(slot.browser.version(), self.health_check_timeout)
+        except Exception as exc:
+            logger.debug("Browser %i health check error: %r", slot.index, exc)
+            return False
+        return True
+
+    def _should_restart(self, slot: _BrowserSlot) -> bool:
+        if slot.restarting:
+            return False
+        if self.max_pages and slot.page_count >= self.max_pages:
+            return True
+        now = monotonic()
+        if (
+            self.max_memory
+            and self._psutil is not None
+            and now - slot.memory_checked_at >= self.memory_check_interval
+        ):
+            slot.memory_checked_at = now
+            memory = _get_process_memory(self._psutil, slot.browser)
+            if memory is not None:
+                self.stats.max_value("pyppeteer/browser/{}/memory_max".format(slot.index), memory)
+                return memory >= self.max_memory
+        return False
+
+    async def _restart(self, slot: _BrowserSlot) -> None:
+        """Replace the browser of a slot, which keeps serving pages in the meantime"""
+        try:
+            new_slot = await self._launch_slot(slot.index)
+        except Exception:
+            # keep using the current browser, the restart will be attempted again
+            logger.exception("Could not restart browser %i", slot.index)
+            return
+        finally:
+            slot.restarting = False
+        if slot not in self._slots:  # relaunched after a crash, or the pool was closed
+            await self._close_slot(new_slot)
+            return
+        self._slots[self._slots.index(slot)] = new_slot
+        slot.retired = True
+        self.stats.inc_value("pyppeteer/browser/{}/restart_count".format(slot.index))
+        logger.info("Restarted browser %i after %i pages", slot.index, slot.page_count)
+        if slot.active == 0:
+            await self._close_slot(slot)
+
+    async def _decrease_active(self, slot: _BrowserSlot) -> None:
+        slot.active -= 1
+        if slot.retired and slot.active == 0 and not slot.disconnected:
+            await self._close_slot(slot)
+
+    async def _close_slot(self, slot: _BrowserSlot) -> None:
+        slot.closing = True
+        if slot.disconnected:
+            # make sure the process is terminated, pages are gone already
+            try:
+                await self._close_browser(slot.browser)
+            except Exception as exc:
+                logger.debug("Error closing disconnected browser %i: %r", slot.index, exc)
+            return
+        if slot.page_pool is not None:
+            await slot.page_pool.close()
+        await self._close_browser(slot.browser)
+
+    async def _close_browser(self, browser: "Browser") -> None:
+        if self.remote:
+            await browser.disconnect()  # leave remote browsers running
+        else:
+            await browser.close()
+
+
+def _import_psutil() -> Optional[ModuleType]:
+    # psutil is optional, and only imported if the memory usage is to be checked
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil
+
+
+def _get_process_memory(psutil: Any, browser: "Browser") -> Optional[int]:
+    """Resident memory (in bytes) used by a browser process and its children"""
+    if browser.process is None:
+        return None
+    try:
+        process = psutil.Process(browser.process.pid)
+        return sum(p.memory_info().rss for p in [process] + process.children(recursive=True))
+    except psutil.Error:
+        return None
@@ -0,0 +1,114 @@
+import re
+from collections import defaultdict
+from typing import Callable, DefaultDict, List, Optional, Set
+
+from scrapy.http import HtmlResponse, Request, Response
+from scrapy.settings import Settings
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.misc import load_object
+
+
+DEFAULT_MARKERS = [
+    "enable javascript",
+    "javascript is required",
+    "javascript is disabled",
+    "requires javascript",
+]
+
+
+class AdaptiveRouter:
+    """
+    Decide whether a request can be served by the regular HTTP download handler or needs
+    to be rendered by the browser. Responses downloaded over HTTP are inspected by a
+    "needs rendering" detector: a selector which must be present, markers (lowercase
+    substrings or regular expressions) which must not be present, a minimum body size
+    and an optional user-provided callable.
+
+    Decisions are learned per key (the domain, or the domain and the first path segment):
+    after "threshold" consecutive escalations, requests for the key go straight to the
+    browser for the rest of the crawl.
+    """
+
+    def __init__(
+        self,
+        stats: StatsCollector,
+        selector: Optional[str] = None,
+        markers: Optional[List[str]] = None,
+        min_body_size: int = 0,
+        detector: Optional[Callable[[Response], bool]] = None,
+        threshold: int = 3,
+        key: str = "domain",
+    ) -> None:
+        if key not in ("domain", "path"):
+            raise ValueError("Invalid adaptive routing key: %r" % key)
+        self.stats = stats
+        self.selector = selector
+        self.markers = re.compile("|".join(markers), re.IGNORECASE) if markers else None
+        self.min_body_size = min_body_size
+        self.detector = detector
+        self.threshold = threshold
+        self.key = key
+        self._escalations: DefaultDict[str, int] = defaultdict(int)
+        self._browser_keys: Set[str] = set()
+
+    @classmethod
+    def from_settings(cls, settings: Settings, stats: StatsCollector) -> "AdaptiveRouter":
+        detector = settings.get("PYPPETEER_ADAPTIVE_DETECTOR")
+        if isinstance(detector, str):
+            detector = load_object(detector)
+        return cls(
+            stats=stats,
+            selector=settings.get("PYPPETEER_ADAPTIVE_SELECTOR"),
+            markers=settings.getlist("PYPPETEER_ADAPTIVE_MARKERS", DEFAULT_MARKERS),
+            min_body_size=settings.getint("PYPPETEER_ADAPTIVE_MIN_BODY_SIZE"),
+            detector=detector,
+            threshold=settings.getint("PYPPETEER_ADAPTIVE_THRESHOLD", 3),
+            key=settings.get("PYPPETEER_ADAPTIVE_KEY", "domain"),
+        )
+
+    def use_browser(self, request: Request) -> bool:
+        """Whether the request should skip the HTTP attempt, according to previous results"""
+        return self._get_key(request) in self._browser_keys
+
+    def needs_rendering(self, request: Request, response: Response) -> Optional[str]:
+        """Return the reason why the response needs to be rendered by the browser, if any"""
+        if response.status != 200 or not isinstance(response, HtmlResponse):
+            return None
+        selector = request.meta.get("pyppeteer_wait_for", self.selector)
+        if isinstance(selector, str) and not response.css(selector):
+            return "selector"
+        if self.markers is not None and self.markers.search(response.text):
+            return "marker"
+        if len(response.body) < self.min_body_size:
+            return "body_size"
+        if self.detector is not None and self.detector(response):
+            return "detector"
+        return None
+
+    def record(self, request: Request, reason: Optional[str]) -> None:
+        key = self._get_key(request)
+        if reason is None:
+            self._escalations.pop(key, None)
+            self.stats.inc_value("pyppeteer/adaptive/http")
+            return
+        self.stats.inc_value("pyppeteer/adaptive/escalated")
+        self.stats.inc_value("pyppeteer/adaptive/escalated/%s" % reason)
+        self._escalations[key] += 1
+        if self._escalations[key] >= self.threshold and key not in self._browser_keys:
+            self._browser_keys.add(key)
+            self.stats.inc_value("pyppeteer/adaptive/browser_keys")
+
+    def escalation_rate(self) -> Optional[float]:
+        http = self.stats.get_value("pyppeteer/adaptive/http", 0)
+        escalated = self.stats.get_value("pyppeteer/adaptive/escalated", 0)
+        if not http + escalated:
+            return None
+        return round(escalated / (http + escalated), 4)
+
+    def _get_key(self, request: Request) -> str:
+        parsed = urlparse_cached(request)
+        key = parsed.hostname or ""
+        if self.key == "path":
+            key += "/" + parsed.path.lstrip("/").split("/", 1)[0]
+        return key
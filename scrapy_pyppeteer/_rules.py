@@ -0,0 +1,75 @@
+import re
+from fnmatch import translate
+from typing import Iterable, Optional, Pattern, Union
+from urllib.parse import urlparse
+
+from scrapy.settings import Settings
+
+
+class AbortRules:
+    """
+    Decide which subresource requests should be aborted instead of being
+    performed by the browser. A request is aborted if any of these hold:
+
+    * its resource type ("image", "font", "media", etc) is in resource_types
+    * its URL matches any of the url_patterns (strings are interpreted as glob
+      patterns matching the whole URL, compiled regular expressions are searched for)
+    * allowed_domains is not empty and the request domain is not in it
+    * the request domain is in denied_domains
+
+    Subdomains are also matched when checking domains.
+    """
+
+    def __init__(
+        self,
+        resource_types: Iterable[str] = (),
+        url_patterns: Iterable[Union[str, Pattern]] = (),
+        allowed_domains: Iterable[str] = (),
+        denied_domains: Iterable[str] = (),
+    ) -> None:
+        self.resource_types = frozenset(t.lower() for t in resource_types)
+        self.allowed_domains = tuple(d.lower().lstrip(".") for d in allowed_domains)
+        self.denied_domains = tuple(d.lower().lstrip(".") for d in denied_domains)
+        self.url_regex: Optional[Pattern] = None
+        regexes = [
+            p.pattern if isinstance(p, Pattern) else "^" + translate(p) for p in url_patterns
+        ]
+        if regexes:
+            self.url_regex = re.compile("|".join("(?:%s)" % r for r in regexes))
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "AbortRules":
+        return cls(
+            resource_types=settings.getlist("PYPPETEER_ABORT_RESOURCE_TYPES"),
+            url_patterns=settings.getlist("PYPPETEER_ABORT_URL_PATTERNS"),
+            allowed_domains=settings.getlist("PYPPETEER_ALLOWED_DOMAINS"),
+            denied_domains=settings.getlist("PYPPETEER_DENIED_DOMAINS"),
+        )
+
+    @classmethod
+    def from_meta(cls, value: Union["AbortRules", dict, None]) -> "AbortRules":
+        if isinstance(value, AbortRules):
+            return value
+        return cls(**(value or {}))
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.resource_types or self.url_regex or self.allowed_domains or self.denied_domains
+        )
+
+    def should_abort(self, url: str, resource_type: str) -> bool:
+        if resource_type in self.resource_types:
+            return True
+        if self.url_regex is not None and self.url_regex.search(url):
+            return True
+        if self.allowed_domains or self.denied_domains:
+            domain = (urlparse(url).hostname or "").lower()
+            if self.allowed_domains and not _domain_matches(domain, self.allowed_domains):
+                return True
+            if _domain_matches(domain, self.denied_domains):
+                return True
+        return False
+
+
+def _domain_matches(domain: str, domains: tuple) -> bool:
+    return any(domain == d or domain.endswith("." + d) for d in domains)
@@ -0,0 +1,25 @@
+from collections import Counter
+
+from scrapy.statscollectors import StatsCollector
+
+
+class PageStats:
+    """
+    Counters for the requests and responses of a page, kept locally and added to the
+    StatsCollector once per page instead of on every interception event.
+    Keys are either stat names or (prefix, value) tuples, only formatted when flushed.
+    If "subresources" is False, only navigation requests and responses are counted.
+    """
+
+    __slots__ = ("counts", "subresources")
+
+    def __init__(self, subresources: bool = True) -> None:
+        self.counts: Counter = Counter()
+        self.subresources = subresources
+
+    def flush(self, stats: StatsCollector) -> None:
+        for key, value in self.counts.items():
+            if isinstance(key, tuple):
+                key = "%s/%s" % key
+            stats.inc_value(key, value)
+        self.counts.clear()
@@ -0,0 +1,97 @@
+import math
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from time import perf_counter, time
+from typing import DefaultDict, Dict, Iterator, List, Tuple
+
+
+class PhaseTimer:
+    """
+    Measure the duration of the phases of a request using time.perf_counter.
+    Spans are stored as (phase, offset from the start of the request, duration) tuples,
+    all values in seconds. Phases which happen more than once are summed in "timings".
+    """
+
+    def __init__(self) -> None:
+        self.start_time = time()
+        self._start = perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, start - self._start, perf_counter() - start))
+
+    @property
+    def elapsed(self) -> float:
+        return perf_counter() - self._start
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        timings: Dict[str, float] = {}
+        for name, _, duration in self.spans:
+            timings[name] = timings.get(name, 0) + duration
+        return timings
+
+
+class LatencyHistogram:
+    """
+    Histogram with logarithmic buckets (each one 10% wider than the previous one),
+    used to estimate latency percentiles with bounded memory.
+    """
+
+    base = 1.1
+    resolution = 1e-4  # seconds, durations below this value go to the first bucket
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.max = 0.0
+        self._buckets: Counter = Counter()
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.max = max(self.max, value)
+        self._buckets[self._bucket(value)] += 1
+
+    def percentile(self, percent: float) -> float:
+        """Upper bound of the bucket containing the given percentile"""
+        if not self.count:
+            return 0.0
+        threshold = math.ceil(self.count * percent / 100)
+        accumulated = 0
+        for bucket in sorted(self._buckets):
+            accumulated += self._buckets[bucket]
+            if accumulated >= threshold:
+                return min(self.resolution * self.base ** bucket, self.max)
+        return self.max
+
+    def _bucket(self, value: float) -> int:
+        if value <= self.resolution:
+            return 0
+        return math.ceil(math.log(value / self.resolution, self.base))
+
+
+class TimingStats:
+    """Aggregate per-phase histograms, to be written as percentiles in the stats"""
+
+    percentiles = (50, 95, 99)
+
+    def __init__(self) -> None:
+        self.histograms: DefaultDict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+
+    def add(self, timings: Dict[str, float]) -> None:
+        for phase, duration in timings.items():
+            self.histograms[phase].add(duration)
+
+    def to_stats(self, prefix: str = "pyppeteer/timing") -> Dict[str, float]:
+        stats: Dict[str, float] = {}
+        for phase, histogram in self.histograms.items():
+            key = "{}/{}".format(prefix, phase)
+            stats[key + "/count"] = histogram.count
+            stats[key + "/max"] = round(histogram.max, 6)
+            for percent in self.percentiles:
+                stats["{}/p{}".format(key, percent)] = round(histogram.percentile(percent), 6)
+        return stats
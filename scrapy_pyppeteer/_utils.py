@@ -0,0 +1,18 @@
+import asyncio
+import os
+from pathlib import Path
+from tempfile import mkstemp
+from typing import Any, Awaitable, Callable
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write to a temporary file in the same directory, then move it into place"""
+    fd, tmp_path = mkstemp(dir=str(path.parent), suffix=".tmp")
+    with os.fdopen(fd, "wb") as tmp_file:
+        tmp_file.write(data)
+    os.replace(tmp_path, str(path))
+
+
+def run_in_executor(func: Callable, *args: Any) -> Awaitable:
+    """Run a blocking function in the default executor of the event loop"""
+    return asyncio.get_event_loop().run_in_executor(None, func, *args)
@@ -0,0 +1,17 @@
+from twisted.internet.error import TimeoutError
+
+
+class BrowserDisconnectedError(ConnectionError):
+    """
+    The browser crashed or the connection to it was lost while handling a request.
+    It subclasses ConnectionError (and therefore OSError), so requests failing with
+    this exception are retried by Scrapy's RetryMiddleware.
+    """
+
+
+class RequestTimeoutError(TimeoutError):
+    """
+    The request did not finish before its deadline (PYPPETEER_REQUEST_TIMEOUT or the
+    "pyppeteer_request_timeout" meta key). It subclasses twisted.internet.error.TimeoutError,
+    so requests failing with this exception are retried by Scrapy's RetryMiddleware.
+    """
@@ -1,29 +1,46 @@
 import asyncio
+import json
 import logging
 from functools import partial
 from pathlib import Path
-from time import time
-from typing import Optional, Type, TypeVar
+from typing import TYPE_CHECKING, List, Optional, Tuple, Type, TypeVar, Union
+from urllib.request import urlopen
 
-import pyppeteer
-from pyppeteer.page import Page
 from scrapy import Spider, signals
 from scrapy.core.downloader.handlers.http import HTTPDownloadHandler
 from scrapy.crawler import Crawler
+from scrapy.downloadermiddlewares.cookies import CookiesMiddleware
 from scrapy.http import Request, Response
+from scrapy.http.cookies import CookieJar
 from scrapy.http.headers import Headers
 from scrapy.responsetypes import responsetypes
-from scrapy.statscollectors import StatsCollector
 from scrapy.utils.defer import deferred_from_coro
+from scrapy.utils.httpobj import urlparse_cached
 from scrapy.utils.reactor import verify_installed_reactor
 from twisted.internet.defer import Deferred, inlineCallbacks
 
-from ._monkeypatches import _patch_pyppeteer_connection
-from .page import PageCoroutine, NavigationPageCoroutine
+from ._artifacts import ArtifactStore
+from ._cache import SubresourceCache
+from ._capture import CaptureBudget, ResponseCapture
+from ._cookies import CookieSync
+from ._injection import NO_INJECTION, InjectionPlan, get_injection_plan
+from ._leases import PageLeases
+from ._limiter import PageLimiter
+from ._overrides import RequestOverrides, response_to_dict
+from ._pool import BrowserPool
+from ._router import AdaptiveRouter
+from ._stats import PageStats
+from ._rules import AbortRules
+from ._timing import PhaseTimer, TimingStats
+from .exceptions import BrowserDisconnectedError, RequestTimeoutError
+from .page import PageCoroutine, NavigationPageCoroutine, ParallelPageCoroutines
+from .signals import request_timings
 
-
-_patch_pyppeteer_connection()
-del _patch_pyppeteer_connection
+if TYPE_CHECKING:
+    from pyppeteer.browser import Browser, BrowserContext
+    from pyppeteer.network_manager import Request as PyppeteerRequest
+    from pyppeteer.network_manager import Response as PyppeteerResponse
+    from pyppeteer.page import Page
 
 
 __all__ = ["ScrapyPyppeteerDownloadHandler"]
@@ -33,35 +50,111 @@ logger = logging.getLogger("scrapy-pyppeteer")
 
 
 async def _request_handler(
-    request: pyppeteer.network_manager.Request, scrapy_request: Request, stats: StatsCollector
+    request: "PyppeteerRequest",
+    overrides: RequestOverrides,
+    page_stats: PageStats,
+    abort_rules: AbortRules,
+    cache: Optional[SubresourceCache] = None,
 ) -> None:
     # set headers, method and body
-    if request.url == scrapy_request.url:
-        overrides = {
-            "method": scrapy_request.method,
-            "headers": {
-                key.decode("utf-8").lower(): value[0].decode("utf-8")
-                for key, value in scrapy_request.headers.items()
-            },
-        }
-        if scrapy_request.body:
-            overrides["postData"] = scrapy_request.body.decode(scrapy_request.encoding)
+    if request.url == overrides.url:
+        if overrides.fetch is not None:
+            # the body cannot be sent by the browser, download the response with Scrapy
+            await request.respond(response_to_dict(await overrides.fetch()))
+            page_stats.counts["pyppeteer/request_count"] += 1
+            page_stats.counts["pyppeteer/request_count/fetched"] += 1
+            return
+        payload: Optional[dict] = overrides.main
     else:
-        overrides = {"headers": request.headers.copy()}
-        if scrapy_request.headers.get("user-agent"):
-            user_agent = scrapy_request.headers["user-agent"].decode("utf-8")
-            overrides["headers"]["user-agent"] = user_agent
-    await request.continue_(overrides)
+        if (
+            abort_rules
+            and not _is_main_frame_navigation(request)
+            and abort_rules.should_abort(request.url, request.resourceType)
+        ):
+            await request.abort()
+            if page_stats.subresources:
+                counts = page_stats.counts
+                counts["pyppeteer/request_count"] += 1
+                counts["pyppeteer/request_count/aborted"] += 1
+                counts["pyppeteer/request_count/aborted", request.resourceType] += 1
+            return
+        if cache is not None and cache.accepts(request.method, request.resourceType):
+            cached_response = await cache.get(request.url, request.headers)
+            if cached_response is not None:
+                await request.respond(cached_response)
+                if page_stats.subresources:
+                    page_stats.counts["pyppeteer/request_count"] += 1
+                    page_stats.counts["pyppeteer/request_count/cached"] += 1
+                return
+        payload = overrides.subresource(request.headers)
+    await request.continue_(payload)
     # increment stats
-    stats.inc_value("pyppeteer/request_method_count/{}".format(request.method))
-    stats.inc_value("pyppeteer/request_count")
-    if request.isNavigationRequest():
-        stats.inc_value("pyppeteer/request_count/navigation")
+    navigation = request.isNavigationRequest()
+    if navigation or page_stats.subresources:
+        counts = page_stats.counts
+        counts["pyppeteer/request_method_count", request.method] += 1
+        counts["pyppeteer/request_count"] += 1
+        counts["pyppeteer/request_count/allowed"] += 1
+        if navigation:
+            counts["pyppeteer/request_count/navigation"] += 1
+
+
+async def _response_handler(
+    response: "PyppeteerResponse",
+    page_stats: PageStats,
+    cache: Optional[SubresourceCache] = None,
+) -> None:
+    navigation = response.request.isNavigationRequest()
+    if navigation or page_stats.subresources:
+        page_stats.counts["pyppeteer/response_count"] += 1
+        page_stats.counts["pyppeteer/response_status_count", response.status] += 1
+    if (
+        cache is not None
+        and response.status == 200
+        and not navigation
+        and cache.accepts(response.request.method, response.request.resourceType)
+        and cache.should_store(response.url, response.request.headers, response.headers)
+    ):
+        try:
+            body = await response.buffer()
+        except Exception as exc:
+            logger.debug("Could not get the body of %s to cache it: %r", response.url, exc)
+        else:
+            await cache.put(
+                response.url, response.request.headers, response.status, response.headers, body
+            )
+
+
+def _is_main_frame_navigation(request: "PyppeteerRequest") -> bool:
+    """Navigations of the page itself, i.e. redirects or NavigationPageCoroutine"""
+    frame = request.frame
+    return request.isNavigationRequest() and frame is not None and frame.parentFrame is None
 
 
-async def _response_handler(response: pyppeteer.network_manager.Response, stats: StatsCollector):
-    stats.inc_value("pyppeteer/response_count")
-    stats.inc_value("pyppeteer/response_status_count/{}".format(response.status))
+def _runs_page_coroutines(request: Request) -> bool:
+    return bool(request.meta.get("pyppeteer_page_coroutines")) or isinstance(
+        request.meta.get("pyppeteer_body"), PageCoroutine
+    )
+
+
+def _get_artifact_extension(pc: PageCoroutine) -> Optional[str]:
+    """File extension for the output of screenshot and pdf coroutines without a path"""
+    if pc.method not in ("screenshot", "pdf"):
+        return None
+    options = dict(pc.args[0]) if pc.args and isinstance(pc.args[0], dict) else {}
+    options.update(pc.kwargs.get("options") or {})
+    options.update(pc.kwargs)
+    if options.get("path"):
+        return None  # written by pyppeteer
+    if pc.method == "pdf":
+        return ".pdf"
+    return ".jpg" if options.get("type") == "jpeg" else ".png"
+
+
+def _get_ws_endpoint(url: str) -> str:
+    """Websocket URL of the browser listening at the given http://host:port URL"""
+    with urlopen(url.rstrip("/") + "/json/version", timeout=10) as response:
+        return json.loads(response.read().decode("utf8"))["webSocketDebuggerUrl"]
 
 
 PyppeteerHandler = TypeVar("PyppeteerHandler", bound="ScrapyPyppeteerDownloadHandler")
@@ -72,8 +165,10 @@ class ScrapyPyppeteerDownloadHandler(HTTPDownloadHandler):
         super().__init__(settings=crawler.settings, crawler=crawler)
         verify_installed_reactor("twisted.internet.asyncioreactor.AsyncioSelectorReactor")
         crawler.signals.connect(self._engine_started_handler, signals.engine_started)
+        crawler.signals.connect(self._spider_closed_handler, signals.spider_closed)
+        self.crawler = crawler
         self.stats = crawler.stats
-        self.browser: Optional[pyppeteer.browser.Browser] = None
+        self.timing_stats = TimingStats()
 
         # read settings
         self.navigation_timeout: Optional[int] = None
@@ -84,101 +179,479 @@ class ScrapyPyppeteerDownloadHandler(HTTPDownloadHandler):
             self.page_coroutine_timeout = crawler.settings.getint(
                 "PYPPETEER_PAGE_COROUTINE_TIMEOUT"
             )
+        self.wait_until: Optional[Union[str, List[str]]] = crawler.settings.get(
+            "PYPPETEER_WAIT_UNTIL"
+        )
+        self.request_timeout: Optional[float] = None
+        if crawler.settings.get("PYPPETEER_REQUEST_TIMEOUT"):
+            self.request_timeout = crawler.settings.getfloat("PYPPETEER_REQUEST_TIMEOUT")
         self.launch_options: dict = crawler.settings.getdict("PYPPETEER_LAUNCH_OPTIONS") or {}
-        if (
-            "executablePath" not in self.launch_options
-            and Path(pyppeteer.executablePath()).is_file()
-        ):
-            self.launch_options["executablePath"] = pyppeteer.executablePath()
-        logger.info("Browser launch options: %s" % self.launch_options)
+        self.lazy_launch = crawler.settings.getbool("PYPPETEER_LAZY_LAUNCH")
+        self.connect_endpoints: List[str] = crawler.settings.getlist("PYPPETEER_CONNECT_ENDPOINTS")
+
+        page_pool_idle_timeout = crawler.settings.get("PYPPETEER_PAGE_POOL_IDLE_TIMEOUT", 60)
+        browser_max_memory = crawler.settings.getint("PYPPETEER_BROWSER_MAX_MEMORY_MB")
+        context_idle_timeout = crawler.settings.get("PYPPETEER_CONTEXT_IDLE_TIMEOUT")
+        health_check_interval = crawler.settings.getfloat(
+            "PYPPETEER_HEALTH_CHECK_INTERVAL", 30 if self.connect_endpoints else 0
+        )
+        self.browser_pool = BrowserPool(
+            launch=self._launch,
+            create_page=self._create_page,
+            stats=self.stats,
+            size=(
+                len(self.connect_endpoints)
+                or max(crawler.settings.getint("PYPPETEER_BROWSER_COUNT", 1), 1)
+            ),
+            page_pool_size=crawler.settings.getint("PYPPETEER_PAGE_POOL_SIZE"),
+            page_pool_idle_timeout=(
+                float(page_pool_idle_timeout) if page_pool_idle_timeout is not None else None
+            ),
+            max_pages=crawler.settings.getint("PYPPETEER_BROWSER_MAX_PAGES") or None,
+            max_memory=browser_max_memory * 1024 * 1024 if browser_max_memory else None,
+            max_contexts=crawler.settings.getint("PYPPETEER_MAX_CONTEXTS") or None,
+            context_idle_timeout=(
+                float(context_idle_timeout) if context_idle_timeout is not None else None
+            ),
+            strategy=crawler.settings.get("PYPPETEER_BROWSER_STRATEGY", "least_loaded"),
+            remote=bool(self.connect_endpoints),
+            health_check_interval=health_check_interval or None,
+            health_check_timeout=crawler.settings.getfloat("PYPPETEER_HEALTH_CHECK_TIMEOUT", 10),
+        )
+        self.abort_rules = AbortRules.from_settings(crawler.settings)
+        self.subresource_stats = crawler.settings.getbool("PYPPETEER_SUBRESOURCE_STATS", True)
+        self.adaptive_routing = crawler.settings.getbool("PYPPETEER_ADAPTIVE_ROUTING")
+        self.router = AdaptiveRouter.from_settings(crawler.settings, self.stats)
+        self.cache = SubresourceCache.from_settings(crawler.settings, self.stats)
+        self.artifacts = ArtifactStore.from_settings(crawler.settings, self.stats)
+        capture_max_size = crawler.settings.getint("PYPPETEER_CAPTURE_MAX_SIZE_MB", 10)
+        capture_max_total = crawler.settings.getint("PYPPETEER_CAPTURE_MAX_TOTAL_SIZE_MB", 100)
+        self.capture_max_bytes = capture_max_size * 1024 * 1024 if capture_max_size else None
+        self.capture_budget = CaptureBudget(
+            capture_max_total * 1024 * 1024 if capture_max_total else None
+        )
+        self.capture_resource_types: List[str] = crawler.settings.getlist(
+            "PYPPETEER_CAPTURE_RESOURCE_TYPES", ["xhr", "fetch"]
+        )
+        self.capture_timeout = crawler.settings.getfloat("PYPPETEER_CAPTURE_TIMEOUT", 5)
+        self.cookie_sync: Optional[CookieSync] = None
+        if crawler.settings.getbool("PYPPETEER_COOKIE_SYNC"):
+            self.cookie_sync = CookieSync(self.stats)
+        injected_page_timeout = crawler.settings.get("PYPPETEER_INJECTED_PAGE_TIMEOUT")
+        self.page_leases = PageLeases(
+            stats=self.stats,
+            timeout=float(injected_page_timeout) if injected_page_timeout is not None else None,
+            max_pages=crawler.settings.getint("PYPPETEER_MAX_INJECTED_PAGES") or None,
+        )
+        self.page_limiter = PageLimiter(
+            stats=self.stats,
+            max_pages=crawler.settings.getint("PYPPETEER_MAX_CONCURRENT_PAGES") or None,
+            max_pages_per_domain=(
+                crawler.settings.getint("PYPPETEER_MAX_CONCURRENT_PAGES_PER_DOMAIN") or None
+            ),
+        )
 
     @classmethod
     def from_crawler(cls: Type[PyppeteerHandler], crawler: Crawler) -> PyppeteerHandler:
         return cls(crawler)
 
-    def _engine_started_handler(self) -> Deferred:
+    def _engine_started_handler(self) -> Optional[Deferred]:
+        if self.lazy_launch:
+            return None  # launched by the first Pyppeteer request
         return deferred_from_coro(self._launch_browser())
 
+    @property
+    def browser(self) -> Optional["Browser"]:
+        browsers = self.browser_pool.browsers
+        return browsers[0] if browsers else None
+
     async def _launch_browser(self) -> None:
-        self.browser = await pyppeteer.launch(options=self.launch_options)
+        await self.browser_pool.start()
+
+    async def _launch(self, index: int) -> "Browser":
+        # pyppeteer is only imported when a browser is needed
+        import pyppeteer
+        from ._monkeypatches import _patch_pyppeteer_connection
+
+        _patch_pyppeteer_connection()
+        if self.connect_endpoints:
+            return await self._connect(self.connect_endpoints[index])
+        if (
+            "executablePath" not in self.launch_options
+            and Path(pyppeteer.executablePath()).is_file()
+        ):
+            self.launch_options["executablePath"] = pyppeteer.executablePath()
+        logger.info("Browser launch options: %s" % self.launch_options)
+        return await pyppeteer.launch(options=self.launch_options)
+
+    async def _connect(self, endpoint: str) -> "Browser":
+        import pyppeteer
+
+        if not endpoint.startswith(("ws://", "wss://")):
+            # resolve the websocket URL on every (re)connection, it changes if the
+            # remote browser is restarted
+            loop = asyncio.get_event_loop()
+            endpoint = await loop.run_in_executor(None, _get_ws_endpoint, endpoint)
+        options = {
+            key: value
+            for key, value in self.launch_options.items()
+            if key in ("ignoreHTTPSErrors", "defaultViewport", "slowMo", "logLevel")
+        }
+        logger.info("Connecting to browser at %s", endpoint)
+        return await pyppeteer.connect(options, browserWSEndpoint=endpoint)
 
     def download_request(self, request: Request, spider: Spider) -> Deferred:
+        if self._is_adaptive(request, spider):
+            return deferred_from_coro(self._download_request_adaptive(request, spider))
         if request.meta.get("pyppeteer"):
             return deferred_from_coro(self._download_request(request, spider))
         return super().download_request(request, spider)
 
+    def _is_adaptive(self, request: Request, spider: Spider) -> bool:
+        if request.meta.get("pyppeteer") != "auto" and not (
+            self.adaptive_routing and request.meta.get("pyppeteer")
+        ):
+            return False
+        # requests which interact with the page always need the browser
+        if (
+            request.meta.get("pyppeteer_page_coroutines")
+            or request.meta.get("pyppeteer_capture")
+            or isinstance(request.meta.get("pyppeteer_body"), PageCoroutine)
+        ):
+            return False
+        return not get_injection_plan(request.callback or spider.parse)
+
+    async def _download_request_adaptive(self, request: Request, spider: Spider) -> Response:
+        if self.router.use_browser(request):
+            self.stats.inc_value("pyppeteer/adaptive/browser")
+            return await self._download_request(request, spider)
+        response = await self._download_request_over_http(request, spider)
+        reason = self.router.needs_rendering(request, response)
+        self.router.record(request, reason)
+        if reason is None:
+            return response
+        logger.debug("Rendering %s in the browser (reason: %s)", request, reason)
+        return await self._download_request(request, spider)
+
+    async def _download_request_over_http(self, request: Request, spider: Spider) -> Response:
+        dfd = super().download_request(request, spider)
+        return await dfd.asFuture(asyncio.get_event_loop())
+
     async def _download_request(self, request: Request, spider: Spider) -> Response:
-        page = await self._create_page_for_request(request)
+        timer = PhaseTimer()
+        domain = urlparse_cached(request).hostname or ""
+        injection_plan = get_injection_plan(request.callback or spider.parse)
+        if injection_plan.needs_page:
+            with timer.phase("queue"):
+                await self.page_leases.reserve()
+        try:
+            with timer.phase("queue"):
+                await self.page_limiter.acquire(domain)
+        except BaseException:
+            if injection_plan.needs_page:
+                self.page_leases.cancel_reservation()
+            raise
+        deadline = None
+        timeout = request.meta.get("pyppeteer_request_timeout", self.request_timeout)
+        if timeout:
+            # time spent waiting for the concurrency limiter does not count
+            deadline = asyncio.get_event_loop().time() + timeout
+        page_stats = PageStats(subresources=self.subresource_stats)
+        try:
+            with timer.phase("page_acquisition"):
+                page = await self._acquire_page(request, spider, page_stats, deadline)
+        except BaseException:
+            self.page_limiter.release(domain)
+            if injection_plan.needs_page:
+                self.page_leases.cancel_reservation()
+            raise
         try:
-            result = await self._download_request_with_page(request, spider, page)
-        except Exception:
-            if not page.isClosed():
-                await page.close()
-                self.stats.inc_value("pyppeteer/page_count/closed")
+            result = await self._download_request_with_page(
+                request, spider, page, timer, injection_plan, deadline
+            )
+            if injection_plan.needs_page:
+                # count the requests made while the page is used by the callback
+                page.once("close", partial(page_stats.flush, self.stats))
+        except BaseException as exc:
+            disconnected = self.browser_pool.is_disconnected(page)
+            await self.browser_pool.release(page, reuse=False)
+            self.page_limiter.release(domain)
+            if injection_plan.needs_page:
+                self.page_leases.cancel_reservation()
+            if disconnected and isinstance(exc, Exception):
+                raise BrowserDisconnectedError(
+                    "Browser disconnected while downloading {}".format(request)
+                ) from exc
             raise
         else:
+            self._record_timings(request, spider, timer)
             return result
+        finally:
+            page_stats.flush(self.stats)
+
+    async def _acquire_page(
+        self, request: Request, spider: Spider, page_stats: PageStats, deadline: Optional[float]
+    ) -> "Page":
+        if deadline is None:
+            return await self._create_page_for_request(request, spider, page_stats)
+        acquisition = asyncio.ensure_future(
+            self._create_page_for_request(request, spider, page_stats)
+        )
+        try:
+            # creating a page is not interrupted, it could leave an orphan tab in the browser
+            timeout = deadline - asyncio.get_event_loop().time()
+            return await asyncio.wait_for(asyncio.shield(acquisition), timeout)
+        except BaseException as exc:
+            acquisition.add_done_callback(self._release_abandoned_page)
+            if isinstance(exc, asyncio.TimeoutError):
+                raise self._request_timeout(request, "page_acquisition") from exc
+            raise
+
+    def _release_abandoned_page(self, acquisition: asyncio.Future) -> None:
+        if not acquisition.cancelled() and acquisition.exception() is None:
+            asyncio.ensure_future(self.browser_pool.release(acquisition.result(), reuse=False))
 
-    async def _create_page_for_request(self, request: Request) -> Page:
-        page = await self.browser.newPage()  # type: ignore
+    def _request_timeout(self, request: Request, stage: str) -> RequestTimeoutError:
+        self.stats.inc_value("pyppeteer/request_timeout_count")
+        self.stats.inc_value("pyppeteer/request_timeout_count/%s" % stage)
+        timeout = request.meta.get("pyppeteer_request_timeout", self.request_timeout)
+        logger.warning("Deadline exceeded (%s, %.1f seconds) for %s", stage, timeout, request)
+        return RequestTimeoutError("Getting %s took longer than %s seconds" % (request, timeout))
+
+    async def _create_page(self, browser: Union["Browser", "BrowserContext"]) -> "Page":
+        page = await browser.newPage()
         self.stats.inc_value("pyppeteer/page_count")
         if self.navigation_timeout is not None:
             page.setDefaultNavigationTimeout(self.navigation_timeout)
         await page.setRequestInterception(True)
-        page.on("request", partial(_request_handler, scrapy_request=request, stats=self.stats))
-        page.on("response", partial(_response_handler, stats=self.stats))
         return page
 
+    async def _create_page_for_request(
+        self, request: Request, spider: Spider, page_stats: PageStats
+    ) -> "Page":
+        page = await self.browser_pool.acquire(context=request.meta.get("pyppeteer_context"))
+        if "pyppeteer_abort_rules" in request.meta:
+            abort_rules = AbortRules.from_meta(request.meta["pyppeteer_abort_rules"])
+        else:
+            abort_rules = self.abort_rules
+        page.on(
+            "request",
+            partial(
+                _request_handler,
+                overrides=RequestOverrides(
+                    request, fetch=partial(self._download_request_over_http, request, spider)
+                ),
+                page_stats=page_stats,
+                abort_rules=abort_rules,
+                cache=self.cache,
+            ),
+        )
+        page.on("response", partial(_response_handler, page_stats=page_stats, cache=self.cache))
+        return page
+
+    def _get_cookiejar(self, request: Request) -> Optional[CookieJar]:
+        """The jar of the CookiesMiddleware for the request, if the middleware is enabled"""
+        if request.meta.get("dont_merge_cookies"):
+            return None
+        engine = getattr(self.crawler, "engine", None)
+        if engine is None:
+            return None
+        for middleware in engine.downloader.middleware.middlewares:
+            if isinstance(middleware, CookiesMiddleware):
+                return middleware.jars[request.meta.get("cookiejar")]
+        return None
+
     async def _download_request_with_page(
-        self, request: Request, spider: Spider, page: Page
+        self,
+        request: Request,
+        spider: Spider,
+        page: "Page",
+        timer: Optional[PhaseTimer] = None,
+        injection_plan: InjectionPlan = NO_INJECTION,
+        deadline: Optional[float] = None,
     ) -> Response:
-        start_time = time()
-        response = await page.goto(request.url)
+        timer = timer or PhaseTimer()
+        render = self._render_page(request, page, timer)
+        if deadline is None:
+            response, headers, body, url = await render
+        else:
+            try:
+                response, headers, body, url = await asyncio.wait_for(
+                    render, deadline - asyncio.get_event_loop().time()
+                )
+            except asyncio.TimeoutError as exc:
+                raise self._request_timeout(request, "render") from exc
+
+        domain = urlparse_cached(request).hostname or ""
+        await injection_plan.inject(request.cb_kwargs, page, response)
+        if injection_plan.needs_page:
+            self.stats.inc_value("pyppeteer/page_count/injected_callback")
+        else:
+            with timer.phase("page_release"):
+                # page coroutines can change the state of the page (viewport, headers,
+                # scripts to evaluate on new documents, etc), which is not reset
+                await self.browser_pool.release(page, reuse=not _runs_page_coroutines(request))
+            self.page_limiter.release(domain)
+        # time spent waiting for the concurrency limiter is not download latency
+        request.meta["download_latency"] = timer.elapsed - timer.timings.get("queue", 0)
+
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        scrapy_response = respcls(
+            url=url,
+            status=response.status,
+            headers=headers,
+            body=body,
+            request=request,
+            flags=["pyppeteer"],
+        )
+        if injection_plan.needs_page:
+            # the page counts towards the concurrency limits until its lease ends,
+            # which also happens if the browser crashes and the page is never closed
+            release_page = self.browser_pool.detach(page)
+
+            def released() -> None:
+                release_page()
+                self.page_limiter.release(domain)
+
+            self.page_leases.add(page, scrapy_response, on_release=released)
+        return scrapy_response
+
+    async def _render_page(
+        self, request: Request, page: "Page", timer: PhaseTimer
+    ) -> Tuple["PyppeteerResponse", Headers, bytes, str]:
+        """Navigate, run the page coroutines and extract the body, the page is not released"""
+        wait_until = request.meta.get("pyppeteer_wait_until", self.wait_until)
+        wait_for = request.meta.get("pyppeteer_wait_for")
+        if wait_until is None and wait_for is not None:
+            # the condition will be checked as soon as the DOM is ready,
+            # there's no need to wait for images, iframes, etc
+            wait_until = "domcontentloaded"
+        goto_options = {"waitUntil": wait_until} if wait_until else {}
+        domain = urlparse_cached(request).hostname or ""
+        cookie_sync = self.cookie_sync
+        cookiejar = self._get_cookiejar(request) if cookie_sync is not None else None
+        if cookie_sync is not None and cookiejar is not None:
+            with timer.phase("cookies"):
+                await cookie_sync.seed(page, cookiejar, domain)
+        capture = None
+        if request.meta.get("pyppeteer_capture"):
+            capture = ResponseCapture.from_patterns(
+                request.meta["pyppeteer_capture"],
+                stats=self.stats,
+                budget=self.capture_budget,
+                resource_types=self.capture_resource_types,
+                max_bytes=self.capture_max_bytes,
+            )
+            page.on("response", capture.on_response)
+        with timer.phase("navigation"):
+            response = await page.goto(request.url, goto_options)
+        if isinstance(wait_for, str):
+            wait_for = PageCoroutine("waitForSelector", wait_for)
+        if isinstance(wait_for, PageCoroutine):
+            await self._run_page_coroutine(page, wait_for, timer, phase="wait_for")
 
         page_coroutines = request.meta.get("pyppeteer_page_coroutines") or ()
         if isinstance(page_coroutines, dict):
             page_coroutines = page_coroutines.values()
         for pc in page_coroutines:
             if isinstance(pc, PageCoroutine):
-                method = getattr(page, pc.method)
-
-                if self.page_coroutine_timeout is not None and not pc.kwargs.get("timeout", None):
-                    pc.kwargs["timeout"] = self.page_coroutine_timeout
-
-                if isinstance(pc, NavigationPageCoroutine):
-                    await asyncio.gather(page.waitForNavigation(), method(*pc.args, **pc.kwargs))
-                else:
-                    pc.result = await method(*pc.args, **pc.kwargs)
-
-        body = (await page.content()).encode("utf8")
-        request.meta["download_latency"] = time() - start_time
-
-        callback = request.callback or spider.parse
-        annotations = getattr(callback, "__annotations__", {})
-        for key, value in annotations.items():
-            if value is pyppeteer.page.Page:
-                request.cb_kwargs[key] = page
-                self.stats.inc_value("pyppeteer/page_count/injected_callback")
-                break
-        else:
-            if not page.isClosed():
-                await page.close()
-                self.stats.inc_value("pyppeteer/page_count/closed")
+                await self._run_page_coroutine(page, pc, timer)
+            elif isinstance(pc, ParallelPageCoroutines):
+                await asyncio.gather(*[self._run_page_coroutine(page, c, timer) for c in pc])
 
         headers = Headers(response.headers)
         headers.pop("Content-Encoding", None)
-        respcls = responsetypes.from_args(headers=headers, url=page.url, body=body)
-        return respcls(
-            url=page.url,
-            status=response.status,
-            headers=headers,
-            body=body,
+        with timer.phase("content"):
+            body, url = await self._get_body(request, page, response, headers, timer)
+        if capture is not None:
+            with timer.phase("capture"):
+                request.meta["pyppeteer_captured"] = await capture.finish(self.capture_timeout)
+        if cookie_sync is not None and cookiejar is not None:
+            with timer.phase("cookies"):
+                urls = [request.url] if page.url == request.url else [request.url, page.url]
+                await cookie_sync.harvest(page, cookiejar, urls)
+        return response, headers, body, url
+
+    async def _get_body(
+        self,
+        request: Request,
+        page: "Page",
+        response: "PyppeteerResponse",
+        headers: Headers,
+        timer: PhaseTimer,
+    ) -> Tuple[bytes, str]:
+        """
+        Body and URL for the Scrapy response, according to the "pyppeteer_body" meta key.
+        Headers are updated in place if the body is not taken from the main response.
+        """
+        mode = request.meta.get("pyppeteer_body", "content")
+        if mode == "content":
+            return (await page.content()).encode("utf8"), page.url
+        if mode == "raw":
+            # original bytes of the initial navigation response, not re-serialized
+            return await response.buffer(), response.url
+        if isinstance(mode, PageCoroutine):
+            await self._run_page_coroutine(page, mode, timer, phase="extract")
+            if isinstance(mode.result, bytes):
+                return mode.result, page.url
+            if isinstance(mode.result, str):
+                return mode.result.encode("utf8"), page.url
+            headers["Content-Type"] = "application/json"
+            return json.dumps(mode.result).encode("utf8"), page.url
+        raise ValueError(
+            "Invalid value for the pyppeteer_body meta key: %r (expected 'content',"
+            " 'raw' or a PageCoroutine object)" % (mode,)
+        )
+
+    async def _run_page_coroutine(
+        self, page: "Page", pc: PageCoroutine, timer: PhaseTimer, phase: Optional[str] = None
+    ) -> None:
+        method = getattr(page, pc.method)
+
+        if self.page_coroutine_timeout is not None and not pc.kwargs.get("timeout", None):
+            pc.kwargs["timeout"] = self.page_coroutine_timeout
+
+        artifacts = self.artifacts if phase is None else None
+        extension = _get_artifact_extension(pc) if artifacts is not None else None
+
+        with timer.phase(phase or "page_coroutine/" + pc.method):
+            if isinstance(pc, NavigationPageCoroutine):
+                await asyncio.gather(page.waitForNavigation(), method(*pc.args, **pc.kwargs))
+            elif artifacts is not None and extension is not None:
+                kwargs = pc.kwargs
+                if pc.method == "screenshot":
+                    # decoded by the artifact store, outside of the event loop
+                    kwargs = dict(kwargs, encoding="base64")
+                result = await method(*pc.args, **kwargs)
+                pc.result = await artifacts.save(result, extension)
+            else:
+                pc.result = await method(*pc.args, **pc.kwargs)
+
+    def _record_timings(self, request: Request, spider: Spider, timer: PhaseTimer) -> None:
+        timings = timer.timings
+        request.meta["pyppeteer_timings"] = timings
+        self.timing_stats.add(timings)
+        self.crawler.signals.send_catch_log(
+            signal=request_timings,
             request=request,
-            flags=["pyppeteer"],
+            spider=spider,
+            start_time=timer.start_time,
+            spans=timer.spans,
         )
 
+    def _spider_closed_handler(self, spider: Spider) -> None:
+        escalation_rate = self.router.escalation_rate()
+        if escalation_rate is not None:
+            self.stats.set_value(
+                "pyppeteer/adaptive/escalation_rate", escalation_rate, spider=spider
+            )
+        for key, value in self.timing_stats.to_stats().items():
+            self.stats.set_value(key, value, spider=spider)
+
     @inlineCallbacks
     def close(self) -> Deferred:
         yield super().close()
-        if self.browser:
-            yield deferred_from_coro(self.browser.close())
+        yield deferred_from_coro(self.page_leases.close())
+        yield deferred_from_coro(self.browser_pool.close())
+        if self.cache is not None:
+            self.cache.close()
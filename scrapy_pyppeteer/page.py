@@ -1,3 +1,11 @@
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterator, List, Optional
+
+from scrapy.http import HtmlResponse
+
+if TYPE_CHECKING:
+    from pyppeteer.page import Page
+
+
 class PageCoroutine:
     """
     Represents a coroutine to be awaited on a Pyppeteer page,
@@ -8,7 +16,7 @@ class PageCoroutine:
         self.method = method
         self.args = args
         self.kwargs = kwargs
-        self.result = None
+        self.result: Any = None
 
     def __str__(self):
         return "<%s for method '%s'>" % (self.__class__.__name__, self.method)
@@ -26,3 +34,149 @@ class NavigationPageCoroutine(PageCoroutine):
     """
 
     pass
+
+
+class ParallelPageCoroutines:
+    """
+    Group of PageCoroutines to be awaited concurrently, wrapped in asyncio.gather.
+    Use this for independent coroutines which do not change the state of the page,
+    such as "evaluate", "screenshot" or "querySelectorAll".
+
+    Groups are awaited in order with respect to the rest of the page coroutines,
+    the result of each coroutine is stored in its own PageCoroutine.result attribute.
+    """
+
+    def __init__(self, *coroutines: PageCoroutine) -> None:
+        for pc in coroutines:
+            if not isinstance(pc, PageCoroutine) or isinstance(pc, NavigationPageCoroutine):
+                raise TypeError(
+                    "%s only accepts non-navigation PageCoroutine objects, got %r"
+                    % (self.__class__.__name__, pc)
+                )
+        self.coroutines = coroutines
+
+    def __iter__(self) -> Iterator[PageCoroutine]:
+        return iter(self.coroutines)
+
+    def __len__(self) -> int:
+        return len(self.coroutines)
+
+    def __str__(self):
+        return "<%s with %i coroutines>" % (self.__class__.__name__, len(self.coroutines))
+
+    __repr__ = __str__
+
+
+class InfiniteScroll:
+    """
+    Drive an infinite-scroll (or "load more") page, yielding only the elements matching
+    "selector" which appeared since the previous step, as HtmlResponse objects.
+    To be used from a callback which receives the Page object:
+
+        async for fragment in InfiniteScroll("div.quote", max_items=100).iterate(page):
+            for quote in fragment.css("div.quote"):
+                yield {"text": quote.css("span.text::text").get()}
+
+    Each step scrolls to the bottom of the page (or clicks on "load_more_selector", if given)
+    and waits up to "step_timeout" seconds for new elements. Iteration stops when no new
+    elements appear, or after reaching "max_steps", "max_items" or an element matching
+    "stop_selector". Elements are marked with an attribute once yielded, set "remove_seen"
+    to remove them from the page instead, keeping the memory usage of the browser bounded.
+    """
+
+    seen_attribute = "data-scrapy-pyppeteer-seen"
+
+    def __init__(
+        self,
+        selector: str,
+        max_steps: Optional[int] = None,
+        max_items: Optional[int] = None,
+        stop_selector: Optional[str] = None,
+        load_more_selector: Optional[str] = None,
+        step_timeout: float = 5,
+        remove_seen: bool = False,
+    ) -> None:
+        self.selector = selector
+        self.max_steps = max_steps
+        self.max_items = max_items
+        self.stop_selector = stop_selector
+        self.load_more_selector = load_more_selector
+        self.step_timeout = step_timeout
+        self.remove_seen = remove_seen
+        self.steps = 0
+        self.item_count = 0
+
+    async def iterate(self, page: "Page") -> AsyncIterator[HtmlResponse]:
+        # the same object can be used for several pages
+        self.steps = 0
+        self.item_count = 0
+        while True:
+            fragments = await self._collect(page)
+            if self.max_items is not None:
+                fragments = fragments[: self.max_items - self.item_count]
+            if fragments:
+                self.item_count += len(fragments)
+                yield HtmlResponse(
+                    url=page.url,
+                    body="\n".join(fragments),
+                    encoding="utf-8",
+                    flags=["pyppeteer", "fragment"],
+                )
+            if self._should_stop() or (
+                self.stop_selector and await page.querySelector(self.stop_selector)
+            ):
+                break
+            if not await self._next(page):
+                break
+            self.steps += 1
+
+    async def _collect(self, page: "Page") -> List[str]:
+        return await page.evaluate(
+            """(selector, attribute, remove) => {
+                return Array.from(document.querySelectorAll(selector))
+                    .filter(element => !element.hasAttribute(attribute))
+                    .map(element => {
+                        const html = element.outerHTML;
+                        element.setAttribute(attribute, "");
+                        if (remove) element.remove();
+                        return html;
+                    });
+            }""",
+            self.selector,
+            self.seen_attribute,
+            self.remove_seen,
+        )
+
+    def _should_stop(self) -> bool:
+        return (self.max_items is not None and self.item_count >= self.max_items) or (
+            self.max_steps is not None and self.steps >= self.max_steps
+        )
+
+    async def _next(self, page: "Page") -> bool:
+        """Load more elements, return False if there are none"""
+        from pyppeteer.errors import TimeoutError as PyppeteerTimeoutError
+
+        if self.load_more_selector:
+            if await page.querySelector(self.load_more_selector) is None:
+                return False
+            await page.click(self.load_more_selector)
+        else:
+            await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        try:
+            await page.waitForFunction(
+                """(selector, attribute) => {
+                    return Array.from(document.querySelectorAll(selector))
+                        .some(element => !element.hasAttribute(attribute));
+                }""",
+                {"timeout": self.step_timeout * 1000},
+                self.selector,
+                self.seen_attribute,
+            )
+        except PyppeteerTimeoutError:
+            return False
+        return True
+
+    def __str__(self):
+        return "<%s for selector '%s'>" % (self.__class__.__name__, self.selector)
+
+    __repr__ = __str__
@@ -0,0 +1,11 @@
+"""
+Signals sent by the scrapy-pyppeteer download handler.
+Connect to them through the crawler's SignalManager (crawler.signals.connect)
+"""
+
+# Sent after a Pyppeteer request is downloaded, with the following arguments:
+# * request (scrapy.Request): the downloaded request
+# * spider (scrapy.Spider): the spider which sent the request
+# * start_time (float): timestamp (as returned by time.time) of the start of the download
+# * spans (list): (phase, offset, duration) tuples, offset and duration in seconds
+request_timings = object()
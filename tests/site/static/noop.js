@@ -0,0 +1 @@
+window.noopCount = (window.noopCount || 0) + 1;
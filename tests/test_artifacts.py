@@ -0,0 +1,41 @@
+import base64
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from scrapy.utils.test import get_crawler
+
+from scrapy_pyppeteer._artifacts import ArtifactStore
+
+
+@pytest.mark.asyncio
+async def test_artifact_store():
+    with TemporaryDirectory() as path:
+        stats = get_crawler().stats
+        store = ArtifactStore(path=path, stats=stats)
+        first = await store.save(b"foo", ".png")
+        second = await store.save(base64.b64encode(b"foo").decode("ascii"), ".png")
+        assert first.path != second.path
+        assert first.digest == second.digest
+        assert first.size == second.size == 3
+        assert Path(first.path).read_bytes() == Path(second.path).read_bytes() == b"foo"
+        assert stats.get_value("pyppeteer/artifacts/count") == 2
+        assert stats.get_value("pyppeteer/artifacts/bytes") == 6
+        assert len(list(Path(path).iterdir())) == 2
+
+
+@pytest.mark.asyncio
+async def test_artifact_store_dedupe():
+    with TemporaryDirectory() as path:
+        stats = get_crawler().stats
+        store = ArtifactStore(path=path, stats=stats, dedupe=True)
+        first = await store.save(b"foo", ".pdf")
+        second = await store.save(b"foo", ".pdf")
+        third = await store.save(b"bar", ".pdf")
+        assert first == second
+        assert Path(first.path).name == first.digest + ".pdf"
+        assert third.path != first.path
+        assert stats.get_value("pyppeteer/artifacts/count") == 3
+        assert stats.get_value("pyppeteer/artifacts/deduplicated") == 1
+        assert stats.get_value("pyppeteer/artifacts/bytes") == 6
+        assert len(list(Path(path).iterdir())) == 2
@@ -0,0 +1,113 @@
+from tempfile import TemporaryDirectory
+
+import pytest
+from scrapy.utils.test import get_crawler
+
+from scrapy_pyppeteer._cache import SubresourceCache
+
+
+URL = "https://example.org/static/main.js"
+
+
+@pytest.mark.asyncio
+async def test_cache_store_and_load():
+    with TemporaryDirectory() as path:
+        stats = get_crawler().stats
+        cache = SubresourceCache(path=path, stats=stats, max_size=1024)
+        headers = {"cache-control": "public, max-age=60", "content-encoding": "gzip"}
+        assert await cache.get(URL, {}) is None
+        assert cache.should_store(URL, {}, headers)
+        await cache.put(URL, {}, 200, headers, b"var foo;")
+        assert not cache.should_store(URL, {}, headers)
+
+        cached = await cache.get(URL, {})
+        assert cached == {
+            "status": 200,
+            "headers": {"cache-control": "public, max-age=60"},
+            "body": b"var foo;",
+        }
+        assert stats.get_value("pyppeteer/cache/miss") == 1
+        assert stats.get_value("pyppeteer/cache/hit") == 1
+        assert stats.get_value("pyppeteer/cache/stored") == 1
+        cache.close()
+
+        # entries are persisted across instances
+        cache = SubresourceCache(path=path, stats=stats, max_size=1024)
+        assert (await cache.get(URL, {}))["body"] == b"var foo;"
+
+
+@pytest.mark.asyncio
+async def test_cache_control():
+    with TemporaryDirectory() as path:
+        stats = get_crawler().stats
+        cache = SubresourceCache(path=path, stats=stats, max_size=1024)
+        for headers in (
+            {},
+            {"cache-control": "no-store"},
+            {"cache-control": "private, max-age=60"},
+            {"cache-control": "max-age=0"},
+            {"cache-control": "max-age=60", "age": "120"},
+            {"expires": "Thu, 01 Jan 1970 00:00:00 GMT"},
+        ):
+            # the body of uncacheable responses is not even read
+            assert not cache.should_store(URL, {}, headers)
+            await cache.put(URL, {}, 200, headers, b"var foo;")
+            assert await cache.get(URL, {}) is None
+
+        headers = {
+            "date": "Thu, 01 Jan 2015 00:00:00 GMT",
+            "expires": "Thu, 01 Jan 2015 01:00:00 GMT",
+        }
+        await cache.put(URL, {}, 200, headers, b"var foo;")
+        assert await cache.get(URL, {}) is not None
+
+
+@pytest.mark.asyncio
+async def test_cache_vary():
+    with TemporaryDirectory() as path:
+        stats = get_crawler().stats
+        cache = SubresourceCache(path=path, stats=stats, max_size=1024)
+        headers = {"cache-control": "max-age=60", "vary": "Accept-Language"}
+        cache.should_store(URL, {"accept-language": "en"}, headers)
+        await cache.put(URL, {"accept-language": "en"}, 200, headers, b"english")
+        assert cache.should_store(URL, {"accept-language": "es"}, headers)
+        await cache.put(URL, {"accept-language": "es"}, 200, headers, b"spanish")
+
+        assert (await cache.get(URL, {"accept-language": "en"}))["body"] == b"english"
+        assert (await cache.get(URL, {"accept-language": "es"}))["body"] == b"spanish"
+        assert await cache.get(URL, {"accept-language": "fr"}) is None
+
+        # Vary headers are only kept for the URLs with stored entries
+        other = URL + "?other"
+        assert not cache.should_store(other, {}, {"vary": "Accept-Language"})
+        assert other not in cache._vary
+        await cache.put(other, {}, 200, headers, b"other")
+        assert other in cache._vary
+        cache._remove(next(iter(cache._entries)))
+        cache._vary["https://example.org/gone"] = ["accept"]  # e.g. from an older index
+        cache.close()
+        cache = SubresourceCache(path=path, stats=stats, max_size=1024)
+        assert list(cache._vary) == [URL, other]
+        for key in list(cache._entries):
+            cache._remove(key)
+        assert not cache._vary
+
+
+@pytest.mark.asyncio
+async def test_cache_eviction():
+    with TemporaryDirectory() as path:
+        stats = get_crawler().stats
+        cache = SubresourceCache(path=path, stats=stats, max_size=10)
+        headers = {"cache-control": "max-age=60"}
+        await cache.put(URL + "?1", {}, 200, headers, b"12345")
+        await cache.put(URL + "?2", {}, 200, headers, b"12345")  # same body, stored once
+        assert cache.size == 5
+        await cache.put(URL + "?3", {}, 200, headers, b"1234")
+        await cache.get(URL + "?1", {})
+        await cache.put(URL + "?4", {}, 200, headers, b"12")  # evicts ?2 and ?3
+        assert await cache.get(URL + "?1", {}) is not None
+        assert await cache.get(URL + "?2", {}) is None
+        assert await cache.get(URL + "?3", {}) is None
+        assert await cache.get(URL + "?4", {}) is not None
+        assert cache.size == 7
+        assert stats.get_value("pyppeteer/cache/evicted") == 2
@@ -0,0 +1,95 @@
+import asyncio
+import gc
+from types import SimpleNamespace
+
+import pytest
+from scrapy.utils.test import get_crawler
+
+from scrapy_pyppeteer._capture import CaptureBudget, ResponseCapture
+
+
+class MockResponse:
+    def __init__(self, url, body, resource_type="xhr", headers=None, delay=0):
+        self.url = url
+        self.status = 200
+        self.headers = headers or {}
+        self.request = SimpleNamespace(resourceType=resource_type)
+        self._body = body
+        self._delay = delay
+
+    async def buffer(self):
+        await asyncio.sleep(self._delay)
+        return self._body
+
+
+@pytest.mark.asyncio
+async def test_capture():
+    stats = get_crawler().stats
+    capture = ResponseCapture.from_patterns(
+        [r"/api/items", r"/api/users"],
+        stats=stats,
+        budget=CaptureBudget(),
+        resource_types=["xhr", "fetch"],
+    )
+    capture.on_response(MockResponse("https://example.org/api/items", b'{"items": [1, 2]}'))
+    capture.on_response(MockResponse("https://example.org/api/users", b"[]", "fetch"))
+    capture.on_response(MockResponse("https://example.org/api/other", b"{}"))
+    capture.on_response(MockResponse("https://example.org/api/items.js", b"", "script"))
+    captured = await capture.finish()
+    assert [c.url for c in captured] == [
+        "https://example.org/api/items",
+        "https://example.org/api/users",
+    ]
+    assert captured[0].json() == {"items": [1, 2]}
+    assert stats.get_value("pyppeteer/capture/count") == 2
+    assert stats.get_value("pyppeteer/capture/bytes") == 19
+
+
+@pytest.mark.asyncio
+async def test_capture_max_bytes():
+    stats = get_crawler().stats
+    capture = ResponseCapture.from_patterns(
+        r"/api/", stats=stats, budget=CaptureBudget(), max_bytes=10
+    )
+    capture.on_response(MockResponse("https://example.org/api/1", b"x" * 6))
+    capture.on_response(MockResponse("https://example.org/api/2", b"x" * 6))
+    capture.on_response(
+        MockResponse("https://example.org/api/3", b"", headers={"content-length": "11"})
+    )
+    captured = await capture.finish()
+    assert [c.url for c in captured] == ["https://example.org/api/1"]
+    assert stats.get_value("pyppeteer/capture/skipped") == 2
+
+
+@pytest.mark.asyncio
+async def test_capture_budget():
+    stats = get_crawler().stats
+    budget = CaptureBudget(max_bytes=10)
+    first = ResponseCapture.from_patterns(r"/api/", stats=stats, budget=budget)
+    first.on_response(MockResponse("https://example.org/api/1", b"x" * 8))
+    captured = await first.finish()
+    assert budget.used == 8
+
+    second = ResponseCapture.from_patterns(r"/api/", stats=stats, budget=budget)
+    second.on_response(MockResponse("https://example.org/api/2", b"x" * 8))
+    assert await second.finish() == []
+    assert stats.get_value("pyppeteer/capture/skipped") == 1
+
+    # bytes are released when the captured responses are garbage collected
+    del captured, first
+    gc.collect()
+    assert budget.used == 0
+    third = ResponseCapture.from_patterns(r"/api/", stats=stats, budget=budget)
+    third.on_response(MockResponse("https://example.org/api/3", b"x" * 8))
+    assert len(await third.finish()) == 1
+
+
+@pytest.mark.asyncio
+async def test_capture_timeout():
+    stats = get_crawler().stats
+    capture = ResponseCapture.from_patterns(r"/api/", stats=stats, budget=CaptureBudget())
+    capture.on_response(MockResponse("https://example.org/api/fast", b"{}"))
+    capture.on_response(MockResponse("https://example.org/api/slow", b"{}", delay=10))
+    captured = await capture.finish(timeout=0.1)
+    assert [c.url for c in captured] == ["https://example.org/api/fast"]
+    assert stats.get_value("pyppeteer/capture/incomplete") == 1
@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+
+import pytest
+from scrapy.http import Request, Response
+from scrapy.http.cookies import CookieJar
+from scrapy.utils.test import get_crawler
+
+from scrapy_pyppeteer._cookies import CookieSync, _cookies_for_host
+
+
+class MockContext:
+    pass
+
+
+class MockPage:
+    def __init__(self, context):
+        self.target = SimpleNamespace(browserContext=context)
+        self.browser_cookies = []
+        self.set_cookies = []
+
+    async def setCookie(self, *cookies):
+        self.set_cookies.extend(cookies)
+
+    async def cookies(self, *urls):
+        return self.browser_cookies
+
+
+def get_jar():
+    jar = CookieJar()
+    request = Request("https://example.org")
+    response = Response(
+        url="https://example.org",
+        headers={
+            "Set-Cookie": [
+                "session=abc; Path=/; HttpOnly",
+                "consent=yes; Domain=example.org; Path=/",
+            ]
+        },
+    )
+    jar.extract_cookies(response, request)
+    other = Request("https://other.org")
+    jar.extract_cookies(Response(url=other.url, headers={"Set-Cookie": "foo=bar"}), other)
+    return jar
+
+
+@pytest.mark.asyncio
+async def test_seed():
+    stats = get_crawler().stats
+    sync = CookieSync(stats)
+    context = MockContext()
+    jar = get_jar()
+
+    page = MockPage(context)
+    await sync.seed(page, jar, "example.org")
+    assert sorted(page.set_cookies, key=lambda c: c["name"]) == [
+        {
+            "name": "consent",
+            "value": "yes",
+            "path": "/",
+            "secure": False,
+            "httpOnly": False,
+            "domain": ".example.org",
+        },
+        {
+            "name": "session",
+            "value": "abc",
+            "path": "/",
+            "secure": False,
+            "httpOnly": True,
+            "url": "http://example.org/",
+        },
+    ]
+
+    # already in the browser context
+    page = MockPage(context)
+    await sync.seed(page, jar, "example.org")
+    assert page.set_cookies == []
+
+    # a different context does not have them
+    page = MockPage(MockContext())
+    await sync.seed(page, jar, "www.example.org")
+    assert [cookie["name"] for cookie in page.set_cookies] == ["consent"]
+    assert stats.get_value("pyppeteer/cookies/seeded") == 3
+
+
+@pytest.mark.asyncio
+async def test_harvest():
+    stats = get_crawler().stats
+    sync = CookieSync(stats)
+    jar = get_jar()
+    page = MockPage(MockContext())
+    await sync.seed(page, jar, "example.org")
+    page.browser_cookies = [
+        {"name": "session", "value": "abc", "domain": "example.org", "path": "/"},
+        {"name": "consent", "value": "no", "domain": ".example.org", "path": "/"},
+        {
+            "name": "token",
+            "value": "xyz",
+            "domain": "example.org",
+            "path": "/",
+            "expires": 4102444800.5,
+            "session": False,
+            "secure": True,
+            "httpOnly": True,
+        },
+    ]
+    await sync.harvest(page, jar, ["https://example.org"])
+    assert stats.get_value("pyppeteer/cookies/harvested") == 2
+
+    request = Request("https://example.org")
+    jar.add_cookie_header(request)
+    cookies = sorted(request.headers["Cookie"].decode().split("; "))
+    assert cookies == ["consent=no", "session=abc", "token=xyz"]
+    token = next(cookie for cookie in jar.jar if cookie.name == "token")
+    assert token.expires == 4102444800
+    assert token.has_nonstandard_attr("HttpOnly")
+
+    await sync.harvest(page, jar, ["https://example.org"])
+    assert stats.get_value("pyppeteer/cookies/harvested") == 2
+
+
+def test_cookies_for_host():
+    jar = get_jar()
+    assert sorted(c.name for c in _cookies_for_host(jar, "example.org")) == ["consent", "session"]
+    assert [c.name for c in _cookies_for_host(jar, "www.example.org")] == ["consent"]
+    assert [c.name for c in _cookies_for_host(jar, "other.org")] == ["foo"]
+    assert list(_cookies_for_host(jar, "example.com")) == []
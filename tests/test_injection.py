@@ -0,0 +1,94 @@
+import pyppeteer.page
+import pytest
+from pyppeteer.browser import Browser, BrowserContext
+from pyppeteer.connection import CDPSession
+from pyppeteer.network_manager import Response
+from pyppeteer.page import Page
+from scrapy import Spider
+
+from scrapy_pyppeteer._injection import NO_INJECTION, _plans, get_injection_plan
+
+
+class InjectionSpider(Spider):
+    name = "injection"
+
+    def parse(self, response):
+        pass
+
+    async def parse_page(self, response, page: Page, context: BrowserContext, foo: int = 1):
+        pass
+
+    async def parse_objects(
+        self, response, browser: Browser, session: CDPSession, pyppeteer_response: Response
+    ):
+        pass
+
+    async def parse_strings(self, response, page: "pyppeteer.page.Page", other: "Page"):
+        pass
+
+
+class MockTarget:
+    browserContext = "context"
+
+    async def createCDPSession(self):
+        return "session"
+
+
+class MockPage:
+    browser = "browser"
+    target = MockTarget()
+
+
+def test_injection_plan():
+    spider = InjectionSpider()
+    assert get_injection_plan(spider.parse) is NO_INJECTION
+    assert not get_injection_plan(spider.parse)
+
+    plan = get_injection_plan(spider.parse_page)
+    assert plan.arguments == {"page": "page", "context": "context"}
+    assert plan.needs_page
+
+    plan = get_injection_plan(spider.parse_objects)
+    assert plan.arguments == {
+        "browser": "browser",
+        "session": "cdp_session",
+        "pyppeteer_response": "response",
+    }
+    assert plan.needs_page
+
+    # only fully qualified names are recognized in string annotations
+    plan = get_injection_plan(spider.parse_strings)
+    assert plan.arguments == {"page": "page"}
+
+
+def test_injection_plan_cache():
+    spider = InjectionSpider()
+    plan = get_injection_plan(spider.parse_page)
+    assert get_injection_plan(InjectionSpider().parse_page) is plan
+    assert _plans[InjectionSpider.parse_page] is plan
+
+    def callback(response, context: BrowserContext):
+        pass
+
+    plan = get_injection_plan(callback)
+    assert not plan.needs_page
+    assert get_injection_plan(callback) is plan
+    del callback
+    assert plan not in _plans.values()
+
+
+@pytest.mark.asyncio
+async def test_injection_plan_inject():
+    spider = InjectionSpider()
+    page = MockPage()
+    cb_kwargs = {"foo": 2}
+    await get_injection_plan(spider.parse_page).inject(cb_kwargs, page, None)
+    assert cb_kwargs == {"foo": 2, "page": page, "context": "context"}
+
+    cb_kwargs = {}
+    await get_injection_plan(spider.parse_objects).inject(cb_kwargs, page, "response")
+    assert cb_kwargs == {
+        "browser": "browser",
+        "session": "session",
+        "pyppeteer_response": "response",
+    }
@@ -0,0 +1,113 @@
+import asyncio
+import gc
+
+import pytest
+from pyee import EventEmitter
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+
+from scrapy_pyppeteer._leases import PageLeases
+
+
+class MockPage(EventEmitter):
+    url = "https://example.org"
+
+    def __init__(self):
+        super().__init__()
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+        self.emit("close")
+
+
+@pytest.mark.asyncio
+async def test_leases_closed_by_callback():
+    stats = get_crawler().stats
+    leases = PageLeases(stats=stats, timeout=10)
+    page = MockPage()
+    response = Response("https://example.org")
+    await leases.reserve()
+    leases.add(page, response)
+    assert len(leases) == 1
+    await page.close()
+    assert len(leases) == 0
+    del response
+    gc.collect()
+    await asyncio.sleep(0)
+    assert not stats.get_value("pyppeteer/injected_page/leaked")
+    assert not stats.get_value("pyppeteer/injected_page/expired")
+
+
+@pytest.mark.asyncio
+async def test_leases_leaked():
+    stats = get_crawler().stats
+    leases = PageLeases(stats=stats)
+    page = MockPage()
+    await leases.reserve()
+    leases.add(page, Response("https://example.org"))
+    gc.collect()
+    await asyncio.sleep(0.01)
+    assert page.closed
+    assert len(leases) == 0
+    assert stats.get_value("pyppeteer/injected_page/leaked") == 1
+
+
+@pytest.mark.asyncio
+async def test_leases_expired():
+    stats = get_crawler().stats
+    leases = PageLeases(stats=stats, timeout=0.01)
+    page = MockPage()
+    response = Response("https://example.org")
+    await leases.reserve()
+    leases.add(page, response)
+    await asyncio.sleep(0.05)
+    assert page.closed
+    assert len(leases) == 0
+    assert stats.get_value("pyppeteer/injected_page/expired") == 1
+
+
+@pytest.mark.asyncio
+async def test_leases_max_pages():
+    stats = get_crawler().stats
+    leases = PageLeases(stats=stats, max_pages=1)
+    page = MockPage()
+    response = Response("https://example.org")
+    await leases.reserve()
+    leases.add(page, response)
+    reservation = asyncio.ensure_future(leases.reserve())
+    await asyncio.sleep(0.01)
+    assert not reservation.done()
+    assert stats.get_value("pyppeteer/injected_page/wait_count") == 1
+
+    await page.close()
+    await asyncio.wait_for(reservation, 1)
+    leases.cancel_reservation()
+    assert stats.get_value("pyppeteer/injected_page/outstanding_max") == 1
+
+    # outstanding pages are closed when the handler is closed
+    page = MockPage()
+    await leases.reserve()
+    leases.add(page, response)
+    await leases.close()
+    assert page.closed
+    assert len(leases) == 0
+
+
+@pytest.mark.asyncio
+async def test_leases_release_crashed_page():
+    class CrashedPage(MockPage):
+        async def close(self):
+            raise ConnectionError("the browser is gone")
+
+    released = []
+    stats = get_crawler().stats
+    leases = PageLeases(stats=stats, timeout=0.01)
+    page = CrashedPage()
+    response = Response("https://example.org")
+    await leases.reserve()
+    leases.add(page, response, on_release=lambda: released.append(page))
+    await asyncio.sleep(0.05)
+    assert released == [page]  # no "close" event, the lease ended anyway
+    assert len(leases) == 0
+    assert stats.get_value("pyppeteer/injected_page/expired") == 1
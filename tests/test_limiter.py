@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from scrapy.utils.test import get_crawler
+
+from scrapy_pyppeteer._limiter import PageLimiter
+
+
+@pytest.mark.asyncio
+async def test_page_limiter_disabled():
+    limiter = PageLimiter(stats=get_crawler().stats)
+    assert not limiter.enabled
+    for _ in range(100):
+        await limiter.acquire("example.org")
+    assert limiter.active == 0
+    limiter.release("example.org")
+
+
+@pytest.mark.asyncio
+async def test_page_limiter_global():
+    stats = get_crawler().stats
+    limiter = PageLimiter(stats=stats, max_pages=2)
+    order = []
+
+    async def worker(name):
+        await limiter.acquire("example.org")
+        order.append(name)
+
+    await limiter.acquire("example.org")
+    await limiter.acquire("example.org")
+    tasks = [asyncio.ensure_future(worker(i)) for i in range(3)]
+    await asyncio.sleep(0)
+    assert order == []
+    assert len(limiter) == 3
+
+    limiter.release("example.org")
+    limiter.release("example.org")
+    await asyncio.sleep(0)
+    assert order == [0, 1]  # first in, first out
+    limiter.release("example.org")
+    await asyncio.gather(*tasks)
+    assert order == [0, 1, 2]
+    assert limiter.active == 2
+
+    assert stats.get_value("pyppeteer/page_limiter/wait_count") == 3
+    assert stats.get_value("pyppeteer/page_limiter/queue_depth_max") == 3
+    assert stats.get_value("pyppeteer/page_limiter/wait_time_max") >= 0
+
+
+@pytest.mark.asyncio
+async def test_page_limiter_per_domain():
+    limiter = PageLimiter(stats=get_crawler().stats, max_pages=3, max_pages_per_domain=1)
+    await limiter.acquire("a.example")
+    blocked = asyncio.ensure_future(limiter.acquire("a.example"))
+    await asyncio.sleep(0)
+    assert not blocked.done()
+
+    # other domains are not blocked by requests waiting for "a.example"
+    await asyncio.wait_for(limiter.acquire("b.example"), timeout=1)
+
+    limiter.release("a.example")
+    await asyncio.wait_for(blocked, timeout=1)
+    assert limiter.active == 2
+
+
+@pytest.mark.asyncio
+async def test_page_limiter_cancel():
+    limiter = PageLimiter(stats=get_crawler().stats, max_pages=1)
+    await limiter.acquire("example.org")
+    waiting = asyncio.ensure_future(limiter.acquire("example.org"))
+    await asyncio.sleep(0)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    assert len(limiter) == 0
+    limiter.release("example.org")
+    assert limiter.active == 0
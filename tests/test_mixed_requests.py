@@ -5,6 +5,7 @@ from twisted.internet import defer
 from twisted.trial.unittest import TestCase
 
 from scrapy_pyppeteer.handler import ScrapyPyppeteerDownloadHandler
+from scrapy_pyppeteer.page import PageCoroutine
 from tests.mockserver import StaticMockServer
 
 
@@ -42,3 +43,39 @@ class MixedRequestsTestCase(TestCase):
 
         request = Request(self.server.urljoin("/index.html"), meta={"pyppeteer": True})
         return self.handler.download_request(request, Spider("foo")).addCallback(_test)
+
+    def test_adaptive_browser_only(self):
+        self.handler.adaptive_routing = True
+        spider = Spider("foo")
+        url = self.server.urljoin("/index.html")
+        for meta in ({"pyppeteer": True}, {"pyppeteer": "auto"}):
+            self.assertTrue(self.handler._is_adaptive(Request(url, meta=meta), spider))
+            for extra in (
+                {"pyppeteer_capture": [r"/data/"]},
+                {"pyppeteer_page_coroutines": [PageCoroutine("title")]},
+                {"pyppeteer_body": PageCoroutine("title")},
+            ):
+                request = Request(url, meta=dict(meta, **extra))
+                self.assertFalse(self.handler._is_adaptive(request, spider))
+
+    def test_adaptive_request(self):
+        def _test_http(response):
+            self.assertEqual(response.css("a::text").getall(), ["Lorem Ipsum", "Infinite Scroll"])
+            self.assertNotIn("pyppeteer", response.flags)
+
+        def _test_browser(response):
+            # quotes are loaded with JavaScript, the selector is missing from the HTTP response
+            self.assertEqual(len(response.css("div.quote")), 10)
+            self.assertIn("pyppeteer", response.flags)
+            stats = self.handler.stats
+            self.assertEqual(stats.get_value("pyppeteer/adaptive/http"), 1)
+            self.assertEqual(stats.get_value("pyppeteer/adaptive/escalated/selector"), 1)
+
+        request = Request(self.server.urljoin("/index.html"), meta={"pyppeteer": "auto"})
+        dfd = self.handler.download_request(request, Spider("foo")).addCallback(_test_http)
+        request = Request(
+            self.server.urljoin("/scroll.html"),
+            meta={"pyppeteer": "auto", "pyppeteer_wait_for": "div.quote"},
+        )
+        dfd.addCallback(lambda _: self.handler.download_request(request, Spider("foo")))
+        return dfd.addCallback(_test_browser)
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from scrapy_pyppeteer._injection import get_injection_plan
+from scrapy_pyppeteer._monkeypatches import _patch_pyppeteer_connection
+
+
+@pytest.mark.asyncio
+async def test_cancelled_protocol_calls():
+    _patch_pyppeteer_connection()
+    from pyppeteer.connection import CDPSession
+
+    session = CDPSession(None, "page", "session-id", asyncio.get_event_loop())
+    for call_id in (1, 2):
+        future = asyncio.get_event_loop().create_future()
+        future.error = Exception()
+        future.method = "Runtime.evaluate"
+        future.cancel()
+        session._callbacks[call_id] = future
+
+    # responses to cancelled calls are dropped instead of raising InvalidStateError
+    session._on_message('{"id": 1, "result": {}}')
+    session._on_message('{"id": 2, "error": {"message": "Target closed"}}')
+    assert not session._callbacks
+
+
+@pytest.mark.asyncio
+async def test_closed_session_with_cancelled_calls():
+    _patch_pyppeteer_connection()
+    from pyppeteer.connection import CDPSession
+    from pyppeteer.errors import NetworkError
+
+    session = CDPSession(None, "page", "session-id", asyncio.get_event_loop())
+    futures = []
+    for call_id in (1, 2, 3):
+        future = asyncio.get_event_loop().create_future()
+        future.error = NetworkError()
+        future.method = "Runtime.evaluate"
+        session._callbacks[call_id] = future
+        futures.append(future)
+    futures[0].cancel()
+
+    # pending calls are rejected even if there are cancelled ones before them
+    session._on_closed()
+    assert futures[0].cancelled()
+    for future in futures[1:]:
+        with pytest.raises(NetworkError):
+            future.result()
+    assert not session._callbacks
+
+
+@pytest.mark.asyncio
+async def test_closed_connection_with_cancelled_calls():
+    _patch_pyppeteer_connection()
+    from pyppeteer.connection import Connection
+    from pyppeteer.errors import NetworkError
+
+    connection = Connection("ws://127.0.0.1:1/devtools", asyncio.get_event_loop())
+    futures = []
+    for call_id in (1, 2):
+        future = asyncio.get_event_loop().create_future()
+        future.error = NetworkError()
+        future.method = "Browser.getVersion"
+        connection._callbacks[call_id] = future
+        futures.append(future)
+    futures[0].cancel()
+
+    await connection._on_close()
+    with pytest.raises(NetworkError):
+        futures[1].result()
+    assert not connection._callbacks
+
+
+def test_patched_classes_are_injectable():
+    _patch_pyppeteer_connection()
+    from pyppeteer.connection import CDPSession
+
+    async def callback(response, session: CDPSession):
+        pass
+
+    assert get_injection_plan(callback).arguments == {"session": "cdp_session"}
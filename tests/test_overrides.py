@@ -0,0 +1,100 @@
+import pytest
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+
+from scrapy_pyppeteer._overrides import RequestOverrides, response_to_dict
+from scrapy_pyppeteer._stats import PageStats
+from scrapy_pyppeteer.handler import _request_handler
+
+
+class MockRequest:
+    def __init__(self, url, headers=None):
+        self.url = url
+        self.method = "GET"
+        self.headers = headers or {}
+        self.resourceType = "document"
+        self.payload = None
+        self.response = None
+
+    def isNavigationRequest(self):
+        return True
+
+    async def continue_(self, overrides=None):
+        self.payload = overrides
+
+    async def respond(self, response):
+        self.response = response
+
+
+def test_main_overrides():
+    request = Request(
+        url="https://example.org",
+        method="POST",
+        body="ñandú",
+        headers={
+            "Accept": ["text/html", "application/xhtml+xml"],
+            "Cookie": ["a=1", "b=2"],
+            "User-Agent": "scrapy-pyppeteer",
+        },
+    )
+    overrides = RequestOverrides(request)
+    assert overrides.fetch is None
+    assert overrides.main == {
+        "method": "POST",
+        "headers": {
+            "accept": "text/html, application/xhtml+xml",
+            "cookie": "a=1; b=2",
+            "user-agent": "scrapy-pyppeteer",
+        },
+        "postData": "ñandú",
+    }
+    assert overrides.subresource({"accept": "*/*"}) == {
+        "headers": {"accept": "*/*", "user-agent": "scrapy-pyppeteer"}
+    }
+    assert RequestOverrides(Request("https://example.org")).subresource({}) is None
+
+
+def test_binary_body():
+    async def fetch():
+        pass
+
+    request = Request(url="https://example.org", method="POST", body=b"\xff\x00")
+    overrides = RequestOverrides(request, fetch=fetch)
+    assert overrides.fetch is fetch
+    assert "postData" not in overrides.main
+
+
+def test_response_to_dict():
+    response = Response(
+        url="https://example.org",
+        status=201,
+        headers={
+            "Content-Type": "text/plain",
+            "Content-Length": "3",
+            "Set-Cookie": ["a=1", "b=2"],
+        },
+        body=b"abc",
+    )
+    assert response_to_dict(response) == {
+        "status": 201,
+        "headers": {"Content-Type": "text/plain", "set-cookie": "a=1\r\nset-cookie: b=2"},
+        "body": b"abc",
+    }
+
+
+@pytest.mark.asyncio
+async def test_request_handler_fetch():
+    async def fetch():
+        return Response(url="https://example.org", body=b"ok")
+
+    overrides = RequestOverrides(
+        Request(url="https://example.org", method="POST", body=b"\xff"), fetch=fetch
+    )
+    stats = get_crawler().stats
+    page_stats = PageStats()
+    request = MockRequest("https://example.org")
+    await _request_handler(request, overrides, page_stats, abort_rules=None)
+    page_stats.flush(stats)
+    assert request.payload is None
+    assert request.response == {"status": 200, "headers": {}, "body": b"ok"}
+    assert stats.get_value("pyppeteer/request_count/fetched") == 1
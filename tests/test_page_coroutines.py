@@ -1,6 +1,11 @@
 import pytest
 
-from scrapy_pyppeteer.page import PageCoroutine, NavigationPageCoroutine
+from scrapy_pyppeteer.page import (
+    InfiniteScroll,
+    PageCoroutine,
+    NavigationPageCoroutine,
+    ParallelPageCoroutines,
+)
 
 
 @pytest.mark.asyncio
@@ -18,3 +23,46 @@ async def test_page_coroutines():
     assert click.kwargs == {}
     assert click.result is None
     assert str(click) == "<NavigationPageCoroutine for method 'click'>"
+
+
+def test_parallel_page_coroutines():
+    title = PageCoroutine("title")
+    content = PageCoroutine("content")
+    parallel = ParallelPageCoroutines(title, content)
+    assert list(parallel) == [title, content]
+    assert len(parallel) == 2
+    assert str(parallel) == "<ParallelPageCoroutines with 2 coroutines>"
+
+    with pytest.raises(TypeError):
+        ParallelPageCoroutines(title, NavigationPageCoroutine("click", "a"))
+    with pytest.raises(TypeError):
+        ParallelPageCoroutines(title, "content")
+
+
+def test_infinite_scroll():
+    scroll = InfiniteScroll("div.quote", max_steps=2)
+    assert scroll.steps == scroll.item_count == 0
+    assert not scroll._should_stop()
+    scroll.steps = 2
+    assert scroll._should_stop()
+    assert str(scroll) == "<InfiniteScroll for selector 'div.quote'>"
+
+    scroll = InfiniteScroll("div.quote", max_items=10)
+    scroll.item_count = 10
+    assert scroll._should_stop()
+
+
+@pytest.mark.asyncio
+async def test_infinite_scroll_reused():
+    class MockPage:
+        url = "https://example.org"
+
+        async def evaluate(self, *args):
+            return ['<div class="quote">1</div>', '<div class="quote">2</div>']
+
+    scroll = InfiniteScroll("div.quote", max_items=2)
+    for _ in range(2):
+        fragments = [fragment async for fragment in scroll.iterate(MockPage())]
+        assert len(fragments) == 1
+        assert len(fragments[0].css("div.quote")) == 2
+        assert scroll.item_count == 2
@@ -0,0 +1,383 @@
+import asyncio
+
+import pytest
+from pyee import EventEmitter
+from scrapy.utils.test import get_crawler
+
+from scrapy_pyppeteer._pool import BrowserPool, PagePool
+
+
+class MockPage:
+    def __init__(self):
+        self.closed = False
+        self.urls = []
+        self.listeners_removed = 0
+
+    def isClosed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+    async def goto(self, url):
+        self.urls.append(url)
+
+    def remove_all_listeners(self):
+        self.listeners_removed += 1
+
+
+async def create_page(browser=None):
+    page = MockPage()
+    page.browser = browser
+    return page
+
+
+@pytest.mark.asyncio
+async def test_page_pool_reuse():
+    stats = get_crawler().stats
+    pool = PagePool(create_page=create_page, stats=stats, size=1)
+    await pool.fill()
+    assert len(pool) == 1
+
+    page = await pool.acquire()
+    assert len(pool) == 0
+    other_page = await pool.acquire()
+    assert other_page is not page
+
+    await pool.release(page)
+    await pool.release(other_page)  # pool is full
+    assert page.urls == ["about:blank"]
+    assert page.listeners_removed == 1
+    assert not page.closed
+    assert other_page.closed
+    assert (await pool.acquire()) is page
+
+    assert stats.get_value("pyppeteer/page_pool/hit") == 2
+    assert stats.get_value("pyppeteer/page_pool/miss") == 1
+    assert stats.get_value("pyppeteer/page_pool/recycled") == 1
+    assert stats.get_value("pyppeteer/page_count/closed") == 1
+
+
+@pytest.mark.asyncio
+async def test_page_pool_idle_eviction():
+    stats = get_crawler().stats
+    pool = PagePool(create_page=create_page, stats=stats, size=2, idle_timeout=0)
+    await pool.fill()
+    pages = [page for page, _ in pool._idle]
+
+    page = await pool.acquire()
+    assert page not in pages
+    assert all(page.closed for page in pages)
+    assert stats.get_value("pyppeteer/page_pool/evicted") == 2
+    assert stats.get_value("pyppeteer/page_pool/miss") == 1
+
+    await pool.close()
+    assert len(pool) == 0
+
+
+class MockBrowser(EventEmitter):
+    def __init__(self):
+        super().__init__()
+        self.closed = False
+        self.disconnected = False
+        self.hung = False
+        self.process = None
+
+    async def close(self):
+        self.closed = True
+        self.emit("disconnected")
+
+    async def createIncognitoBrowserContext(self):
+        await asyncio.sleep(0)
+        return MockContext(self)
+
+    async def disconnect(self):
+        self.disconnected = True
+        self.emit("disconnected")
+
+    async def version(self):
+        if self.hung:
+            await asyncio.sleep(1)
+        return "HeadlessChrome/71.0.3542.0"
+
+
+async def launch(index):
+    return MockBrowser()
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_least_loaded():
+    stats = get_crawler().stats
+    pool = BrowserPool(launch=launch, create_page=create_page, stats=stats, size=2)
+    await pool.start()
+    first, second = pool.browsers
+
+    page1 = await pool.acquire()
+    page2 = await pool.acquire()
+    assert page1.browser is first
+    assert page2.browser is second
+    await pool.release(page1)
+    page3 = await pool.acquire()
+    assert page3.browser is first  # page2 is still open on the second browser
+
+    assert stats.get_value("pyppeteer/browser/0/page_count") == 2
+    assert stats.get_value("pyppeteer/browser/1/page_count") == 1
+    await pool.close()
+    assert first.closed and second.closed
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_restart():
+    ready = asyncio.Event()
+
+    async def slow_launch(index):
+        await ready.wait()
+        return MockBrowser()
+
+    stats = get_crawler().stats
+    pool = BrowserPool(launch=launch, create_page=create_page, stats=stats, size=1, max_pages=1)
+    await pool.start()
+    (old_browser,) = pool.browsers
+    pool.launch = slow_launch
+
+    # the new browser is launched in the background, the old one is used meanwhile
+    page1 = await pool.acquire()
+    page2 = await pool.acquire()
+    assert page2.browser is old_browser
+    restart = pool._slots[0].restart
+    ready.set()
+    await restart
+    (new_browser,) = pool.browsers
+    assert new_browser is not old_browser
+    page3 = await pool.acquire()
+    assert page3.browser is new_browser
+    assert not old_browser.closed  # page1 and page2 are still in use
+
+    await pool.release(page1)
+    await pool.release(page2)
+    assert page1.closed and page2.closed
+    assert old_browser.closed
+    assert stats.get_value("pyppeteer/browser/0/restart_count") == 1
+    assert stats.get_value("pyppeteer/browser_count") == 2
+    await pool.release(page3)
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_restart_error():
+    async def launch_error(index):
+        raise RuntimeError("could not launch")
+
+    stats = get_crawler().stats
+    pool = BrowserPool(launch=launch, create_page=create_page, stats=stats, size=1, max_pages=1)
+    await pool.start()
+    (browser,) = pool.browsers
+    pool.launch = launch_error
+
+    # the current browser keeps being used, the restart is attempted again
+    page1 = await pool.acquire()
+    page2 = await pool.acquire()
+    await pool._slots[0].restart
+    page3 = await pool.acquire()
+    await pool._slots[0].restart
+    assert pool.browsers == [browser]
+    assert page2.browser is page3.browser is browser
+    assert not stats.get_value("pyppeteer/browser/0/restart_count")
+    for page in (page1, page2, page3):
+        await pool.release(page)
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_disconnected():
+    stats = get_crawler().stats
+    pool = BrowserPool(launch=launch, create_page=create_page, stats=stats, size=1)
+    await pool.start()
+    (old_browser,) = pool.browsers
+
+    page = await pool.acquire()
+    old_browser.emit("disconnected")
+    assert pool.is_disconnected(page)
+    assert stats.get_value("pyppeteer/browser_crash_count") == 1
+    assert stats.get_value("pyppeteer/browser/0/crash_count") == 1
+
+    # new pages wait for the browser to be relaunched
+    new_page = await pool.acquire()
+    (new_browser,) = pool.browsers
+    assert new_browser is not old_browser
+    assert new_page.browser is new_browser
+    assert old_browser.closed
+    assert stats.get_value("pyppeteer/browser_relaunch_count") == 1
+
+    await pool.release(page)
+    assert not page.closed  # not closed explicitly, it's gone with the browser
+    await pool.close()
+    assert new_browser.closed
+    assert stats.get_value("pyppeteer/browser_crash_count") == 1  # closing is not a crash
+
+
+class MockContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_contexts():
+    stats = get_crawler().stats
+    pool = BrowserPool(launch=launch, create_page=create_page, stats=stats, page_pool_size=2)
+    await pool.start()
+    page1 = await pool.acquire(context="first")
+    page2 = await pool.acquire(context="first")
+    page3 = await pool.acquire(context="second")
+    assert page1.browser is page2.browser
+    assert page1.browser is not page3.browser
+    assert isinstance(page1.browser, MockContext)
+    assert stats.get_value("pyppeteer/context_count") == 2
+
+    # pages on incognito contexts are not pooled
+    await pool.release(page1)
+    assert page1.closed
+    assert page1 not in [page for page, _ in pool._slots[0].page_pool._idle]
+
+    await pool.release(page2)
+    await pool.release(page3)
+    await pool.close()
+    assert page2.browser.closed and page3.browser.closed
+    assert stats.get_value("pyppeteer/context/closed") == 2
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_concurrent_contexts():
+    stats = get_crawler().stats
+    pool = BrowserPool(launch=launch, create_page=create_page, stats=stats, max_contexts=2)
+    await pool.start()
+    pages = await asyncio.gather(*[pool.acquire(context="login") for _ in range(3)])
+    assert len({page.browser for page in pages}) == 1
+    assert list(pool._contexts) == ["login"]
+    assert pool._contexts["login"].active == 3
+    assert stats.get_value("pyppeteer/context_count") == 1
+    for page in pages:
+        await pool.release(page)
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_max_contexts():
+    stats = get_crawler().stats
+    pool = BrowserPool(launch=launch, create_page=create_page, stats=stats, max_contexts=1)
+    await pool.start()
+    page1 = await pool.acquire(context="first")
+    second = asyncio.ensure_future(pool.acquire(context="second"))
+    await asyncio.sleep(0.01)
+    assert not second.done()  # waiting for the first context to become idle
+
+    await pool.release(page1)
+    page2 = await second
+    assert page1.browser.closed
+    assert not page2.browser.closed
+    assert stats.get_value("pyppeteer/context/evicted") == 1
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_context_idle_timeout():
+    stats = get_crawler().stats
+    pool = BrowserPool(launch=launch, create_page=create_page, stats=stats, context_idle_timeout=0)
+    await pool.start()
+    page = await pool.acquire(context="first")
+    await pool.release(page)
+    page = await pool.acquire(context="second")
+    assert list(pool._contexts) == ["second"]
+    assert stats.get_value("pyppeteer/context/evicted") == 1
+    await pool.release(page)
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_shared_start():
+    stats = get_crawler().stats
+    pool = BrowserPool(launch=launch, create_page=create_page, stats=stats, size=2)
+    assert not pool.started
+    pages = await asyncio.gather(pool.acquire(), pool.acquire(), pool.start())
+    assert pool.started
+    assert stats.get_value("pyppeteer/browser_count") == 2
+    for page in pages[:2]:
+        await pool.release(page)
+    await pool.close()
+    with pytest.raises(RuntimeError):
+        await pool.acquire()
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_round_robin():
+    pool = BrowserPool(
+        launch=launch,
+        create_page=create_page,
+        stats=get_crawler().stats,
+        size=3,
+        strategy="round_robin",
+    )
+    await pool.start()
+    pages = [await pool.acquire() for _ in range(4)]
+    browsers = pool.browsers
+    assert [page.browser for page in pages] == browsers + browsers[:1]
+    for page in pages:
+        await pool.release(page)
+    await pool.close()
+
+    with pytest.raises(ValueError):
+        BrowserPool(
+            launch=launch, create_page=create_page, stats=get_crawler().stats, strategy="random"
+        )
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_browser_closed():
+    stats = get_crawler().stats
+    pool = BrowserPool(launch=launch, create_page=create_page, stats=stats, size=1)
+    await pool.start()
+    (browser,) = pool.browsers
+    await browser.close()  # closing a browser on purpose is not a crash
+    assert browser.closed
+    assert not stats.get_value("pyppeteer/browser_crash_count")
+    assert pool._slots[0].relaunch is None
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_remote():
+    stats = get_crawler().stats
+    pool = BrowserPool(launch=launch, create_page=create_page, stats=stats, size=2, remote=True)
+    await pool.start()
+    browsers = pool.browsers
+    await pool.close()
+    assert all(browser.disconnected and not browser.closed for browser in browsers)
+    assert not stats.get_value("pyppeteer/browser_crash_count")
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_health_check():
+    stats = get_crawler().stats
+    pool = BrowserPool(
+        launch=launch,
+        create_page=create_page,
+        stats=stats,
+        size=2,
+        remote=True,
+        health_check_interval=0.01,
+        health_check_timeout=0.1,
+    )
+    await pool.start()
+    hung_browser, browser = pool.browsers
+    hung_browser.hung = True
+    await asyncio.sleep(0.3)
+    assert stats.get_value("pyppeteer/browser/0/health_check_failed") == 1
+    assert stats.get_value("pyppeteer/browser_relaunch_count") == 1
+    assert hung_browser.disconnected and not hung_browser.closed
+    assert hung_browser not in pool.browsers
+    assert browser in pool.browsers
+    await pool.close()
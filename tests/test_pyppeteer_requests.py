@@ -1,5 +1,10 @@
+import asyncio
+import gc
+import json
 import subprocess
-from tempfile import NamedTemporaryFile
+import sys
+from pathlib import Path
+from tempfile import NamedTemporaryFile, TemporaryDirectory
 from time import time
 
 import pyppeteer
@@ -8,8 +13,14 @@ from scrapy import Spider, Request, FormRequest
 from scrapy.http.response.html import HtmlResponse
 from scrapy.utils.test import get_crawler
 
+from scrapy_pyppeteer.exceptions import RequestTimeoutError
 from scrapy_pyppeteer.handler import ScrapyPyppeteerDownloadHandler
-from scrapy_pyppeteer.page import PageCoroutine, NavigationPageCoroutine
+from scrapy_pyppeteer.page import (
+    InfiniteScroll,
+    PageCoroutine,
+    NavigationPageCoroutine,
+    ParallelPageCoroutines,
+)
 
 from tests.mockserver import PostMockServer, StaticMockServer
 
@@ -156,6 +167,42 @@ async def test_page_coroutine_screenshot_pdf():
     await handler.browser.close()
 
 
+@pytest.mark.asyncio
+async def test_page_coroutine_artifacts():
+    with TemporaryDirectory() as path:
+        crawler = get_crawler(
+            settings_dict={"PYPPETEER_ARTIFACTS_DIR": path, "PYPPETEER_ARTIFACTS_DEDUPE": True}
+        )
+        handler = ScrapyPyppeteerDownloadHandler(crawler)
+        await handler._launch_browser()
+
+        with StaticMockServer() as server:
+            req = Request(
+                url=server.urljoin("/index.html"),
+                meta={
+                    "pyppeteer": True,
+                    "pyppeteer_page_coroutines": [
+                        PageCoroutine("screenshot", options={"type": "jpeg"}),
+                        PageCoroutine("screenshot", type="jpeg"),
+                        PageCoroutine("pdf"),
+                    ],
+                },
+            )
+            await handler._download_request(req, Spider("foo"))
+
+        first, second, pdf = [pc.result for pc in req.meta["pyppeteer_page_coroutines"]]
+        assert first == second
+        assert first.path.endswith(".jpg")
+        assert Path(first.path).read_bytes()[:2] == b"\xff\xd8"
+        assert pdf.path.endswith(".pdf")
+        assert Path(pdf.path).read_bytes()[:4] == b"%PDF"
+        assert Path(pdf.path).stat().st_size == pdf.size
+        assert crawler.stats.get_value("pyppeteer/artifacts/count") == 3
+        assert crawler.stats.get_value("pyppeteer/artifacts/deduplicated") == 1
+
+        await handler.browser.close()
+
+
 @pytest.mark.asyncio
 async def test_page_coroutine_timeout():
     crawler = get_crawler(settings_dict={"PYPPETEER_NAVIGATION_TIMEOUT": 1000})
@@ -219,3 +266,504 @@ async def test_page_to_callback():
 
     await page.close()
     await handler.browser.close()
+
+
+@pytest.mark.asyncio
+async def test_browser_objects_to_callback():
+    handler = ScrapyPyppeteerDownloadHandler(get_crawler())
+    await handler._launch_browser()
+
+    async def callback(
+        self,
+        response,
+        context: pyppeteer.browser.BrowserContext,
+        pyppeteer_response: pyppeteer.network_manager.Response,
+    ):
+        pass
+
+    with StaticMockServer() as server:
+        req = Request(server.urljoin("/index.html"), callback, meta={"pyppeteer": True})
+        resp = await handler._download_request(req, Spider("foo"))
+
+    # the page is not needed by the callback, it was released
+    assert isinstance(resp.request.cb_kwargs["context"], pyppeteer.browser.BrowserContext)
+    assert resp.request.cb_kwargs["pyppeteer_response"].url == req.url
+    assert not handler.stats.get_value("pyppeteer/page_count/injected_callback")
+
+    await handler.browser_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_page_to_callback_leaked():
+    crawler = get_crawler(
+        settings_dict={"PYPPETEER_MAX_INJECTED_PAGES": 1, "PYPPETEER_INJECTED_PAGE_TIMEOUT": 1}
+    )
+    handler = ScrapyPyppeteerDownloadHandler(crawler)
+    await handler._launch_browser()
+
+    async def callback(self, response, page: pyppeteer.page.Page):
+        pass
+
+    with StaticMockServer() as server:
+        req = Request(server.urljoin("/index.html"), callback, meta={"pyppeteer": True})
+        resp = await handler._download_request(req, Spider("foo"))
+        page = resp.request.cb_kwargs.pop("page")
+        del req, resp
+        gc.collect()  # the response is gone, but the page was not closed
+        await asyncio.sleep(0.5)
+        assert page.isClosed()
+        assert crawler.stats.get_value("pyppeteer/injected_page/leaked") == 1
+
+        # the second request waits until the lease of the first page expires
+        start = time()
+        req = Request(server.urljoin("/index.html"), callback, meta={"pyppeteer": True})
+        resp = await handler._download_request(req, Spider("foo"))
+        req = Request(server.urljoin("/index.html"), callback, meta={"pyppeteer": True})
+        await handler._download_request(req, Spider("foo"))
+        assert time() - start > 1
+        assert resp.request.cb_kwargs["page"].isClosed()
+        assert crawler.stats.get_value("pyppeteer/injected_page/expired") == 1
+        assert crawler.stats.get_value("pyppeteer/injected_page/wait_count") == 1
+
+    await handler.page_leases.close()
+    await handler.browser_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_page_pool():
+    crawler = get_crawler(settings_dict={"PYPPETEER_PAGE_POOL_SIZE": 1})
+    handler = ScrapyPyppeteerDownloadHandler(crawler)
+    await handler._launch_browser()
+
+    with StaticMockServer() as server:
+        for _ in range(3):
+            req = Request(server.urljoin("/index.html"), meta={"pyppeteer": True})
+            resp = await handler._download_request(req, Spider("foo"))
+            assert resp.url == req.url
+            assert resp.css("a::text").getall() == ["Lorem Ipsum", "Infinite Scroll"]
+
+    assert crawler.stats.get_value("pyppeteer/page_count") == 1
+    assert crawler.stats.get_value("pyppeteer/page_pool/hit") == 3
+    assert crawler.stats.get_value("pyppeteer/page_pool/recycled") == 3
+
+    await handler.browser_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_page_pool_page_coroutines():
+    crawler = get_crawler(settings_dict={"PYPPETEER_PAGE_POOL_SIZE": 1})
+    handler = ScrapyPyppeteerDownloadHandler(crawler)
+    await handler._launch_browser()
+
+    with StaticMockServer() as server:
+        req = Request(
+            url=server.urljoin("/index.html"),
+            meta={
+                "pyppeteer": True,
+                "pyppeteer_page_coroutines": [
+                    PageCoroutine("setExtraHTTPHeaders", {"X-Foo": "bar"}),
+                    PageCoroutine("setViewport", {"width": 320, "height": 240}),
+                ],
+            },
+        )
+        await handler._download_request(req, Spider("foo"))
+        assert crawler.stats.get_value("pyppeteer/page_count/closed") == 1
+        assert not crawler.stats.get_value("pyppeteer/page_pool/recycled")
+
+        # the next request gets a new page, without the changes
+        req = Request(
+            url=server.urljoin("/index.html"),
+            meta={
+                "pyppeteer": True,
+                "pyppeteer_body": PageCoroutine("evaluate", "window.innerWidth"),
+            },
+        )
+        resp = await handler._download_request(req, Spider("foo"))
+        assert json.loads(resp.text) != 320
+        assert crawler.stats.get_value("pyppeteer/page_count") == 2
+
+    await handler.browser_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_browser_pool():
+    crawler = get_crawler(
+        settings_dict={"PYPPETEER_BROWSER_COUNT": 2, "PYPPETEER_BROWSER_MAX_PAGES": 2}
+    )
+    handler = ScrapyPyppeteerDownloadHandler(crawler)
+    await handler._launch_browser()
+    assert len(handler.browser_pool.browsers) == 2
+
+    with StaticMockServer() as server:
+        for _ in range(5):
+            req = Request(server.urljoin("/index.html"), meta={"pyppeteer": True})
+            resp = await handler._download_request(req, Spider("foo"))
+            assert resp.css("a::text").getall() == ["Lorem Ipsum", "Infinite Scroll"]
+
+    assert crawler.stats.get_value("pyppeteer/browser/0/page_count") == 3
+    assert crawler.stats.get_value("pyppeteer/browser/1/page_count") == 2
+    assert crawler.stats.get_value("pyppeteer/browser/0/restart_count") == 1
+    assert crawler.stats.get_value("pyppeteer/browser_count") == 3
+
+    await handler.browser_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_incognito_contexts():
+    crawler = get_crawler(settings_dict={"PYPPETEER_MAX_CONTEXTS": 2})
+    handler = ScrapyPyppeteerDownloadHandler(crawler)
+    await handler._launch_browser()
+
+    def get_cookie(context, script="document.cookie"):
+        return Request(
+            url=server.urljoin("/index.html"),
+            meta={
+                "pyppeteer": True,
+                "pyppeteer_context": context,
+                "pyppeteer_page_coroutines": [PageCoroutine("evaluate", script)],
+            },
+            dont_filter=True,
+        )
+
+    with StaticMockServer() as server:
+        req = get_cookie("first", "document.cookie = 'session=first'")
+        await handler._download_request(req, Spider("foo"))
+        for context, cookie in (("first", "session=first"), ("second", "")):
+            req = get_cookie(context)
+            await handler._download_request(req, Spider("foo"))
+            assert req.meta["pyppeteer_page_coroutines"][0].result == cookie
+
+        # the least recently used context is closed, its cookies are lost
+        await handler._download_request(get_cookie("third"), Spider("foo"))
+        req = get_cookie("first")
+        await handler._download_request(req, Spider("foo"))
+        assert req.meta["pyppeteer_page_coroutines"][0].result == ""
+
+    assert crawler.stats.get_value("pyppeteer/context_count") == 4
+    assert crawler.stats.get_value("pyppeteer/context/evicted") == 2
+
+    await handler.browser_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_infinite_scroll():
+    handler = ScrapyPyppeteerDownloadHandler(get_crawler())
+    await handler._launch_browser()
+
+    with StaticMockServer() as server:
+        page = await handler.browser_pool.acquire()
+        await page.goto(server.urljoin("/scroll.html"))
+        await page.waitForSelector("div.quote")
+        scroll = InfiniteScroll("div.quote", step_timeout=2)
+        counts = []
+        async for fragment in scroll.iterate(page):
+            assert isinstance(fragment, HtmlResponse)
+            assert fragment.url == server.urljoin("/scroll.html")
+            counts.append(len(fragment.css("div.quote")))
+        assert counts == [10, 10, 10]
+        assert scroll.item_count == 30
+
+        await page.reload()
+        await page.waitForSelector("div.quote")
+        scroll = InfiniteScroll("div.quote", max_items=15, remove_seen=True)
+        counts = [len(fragment.css("div.quote")) async for fragment in scroll.iterate(page)]
+        assert counts == [10, 5]
+        assert await page.querySelectorAll("div.quote") == []
+        await handler.browser_pool.release(page)
+
+    await handler.browser_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_lazy_launch():
+    crawler = get_crawler(settings_dict={"PYPPETEER_LAZY_LAUNCH": True})
+    handler = ScrapyPyppeteerDownloadHandler(crawler)
+    assert handler._engine_started_handler() is None
+    assert handler.browser is None
+
+    with StaticMockServer() as server:
+        # concurrent requests wait for the same launch
+        responses = await asyncio.gather(
+            *[
+                handler._download_request(
+                    Request(server.urljoin("/index.html"), meta={"pyppeteer": True}),
+                    Spider("foo"),
+                )
+                for _ in range(3)
+            ]
+        )
+        assert all(resp.status == 200 for resp in responses)
+    assert handler.browser is not None
+    assert crawler.stats.get_value("pyppeteer/browser_count") == 1
+
+    await handler.browser_pool.close()
+
+
+def test_deferred_imports():
+    code = (
+        "import sys, scrapy_pyppeteer.handler, scrapy_pyppeteer.page;"
+        " assert 'pyppeteer' not in sys.modules and 'websockets' not in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+@pytest.mark.asyncio
+async def test_connect_endpoints():
+    remote_browsers = [await pyppeteer.launch() for _ in range(2)]
+    endpoints = [browser.wsEndpoint for browser in remote_browsers]
+    crawler = get_crawler(
+        settings_dict={
+            "PYPPETEER_CONNECT_ENDPOINTS": endpoints,
+            "PYPPETEER_BROWSER_STRATEGY": "round_robin",
+        }
+    )
+    handler = ScrapyPyppeteerDownloadHandler(crawler)
+    await handler._launch_browser()
+    assert [browser.wsEndpoint for browser in handler.browser_pool.browsers] == endpoints
+
+    with StaticMockServer() as server:
+        for _ in range(4):
+            req = Request(server.urljoin("/index.html"), meta={"pyppeteer": True})
+            resp = await handler._download_request(req, Spider("foo"))
+            assert resp.status == 200
+    assert crawler.stats.get_value("pyppeteer/browser/0/page_count") == 2
+    assert crawler.stats.get_value("pyppeteer/browser/1/page_count") == 2
+
+    # remote browsers are left running
+    await handler.browser_pool.close()
+    for browser in remote_browsers:
+        assert await browser.version()
+        await browser.close()
+
+
+@pytest.mark.asyncio
+async def test_abort_rules():
+    crawler = get_crawler(settings_dict={"PYPPETEER_ABORT_RESOURCE_TYPES": ["stylesheet"]})
+    handler = ScrapyPyppeteerDownloadHandler(crawler)
+    await handler._launch_browser()
+
+    with StaticMockServer() as server:
+        req = Request(
+            url=server.urljoin("/scroll.html"),
+            meta={
+                "pyppeteer": True,
+                "pyppeteer_page_coroutines": [PageCoroutine("waitForSelector", "div.quote")],
+            },
+        )
+        resp = await handler._download_request(req, Spider("foo"))
+        assert len(resp.css("div.quote")) == 10
+        assert crawler.stats.get_value("pyppeteer/request_count/aborted/stylesheet") == 2
+
+        # rules from the request meta replace the ones from the settings
+        req = Request(
+            url=server.urljoin("/scroll.html"),
+            meta={"pyppeteer": True, "pyppeteer_abort_rules": {"url_patterns": ["*.js"]}},
+        )
+        resp = await handler._download_request(req, Spider("foo"))
+        assert len(resp.css("div.quote")) == 0  # jquery was not loaded
+        assert crawler.stats.get_value("pyppeteer/request_count/aborted/stylesheet") == 2
+        assert crawler.stats.get_value("pyppeteer/request_count/aborted/script") == 1
+
+    await handler.browser_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_wait_for_selector():
+    crawler = get_crawler(settings_dict={"PYPPETEER_WAIT_UNTIL": "networkidle0"})
+    handler = ScrapyPyppeteerDownloadHandler(crawler)
+    await handler._launch_browser()
+
+    with StaticMockServer() as server:
+        req = Request(server.urljoin("/scroll.html"), meta={"pyppeteer": True})
+        resp = await handler._download_request(req, Spider("foo"))
+        assert len(resp.css("div.quote")) == 10
+
+        req = Request(
+            url=server.urljoin("/scroll.html"),
+            meta={
+                "pyppeteer": True,
+                "pyppeteer_wait_until": None,
+                "pyppeteer_wait_for": "div.quote",
+            },
+        )
+        resp = await handler._download_request(req, Spider("foo"))
+        assert len(resp.css("div.quote")) == 10
+
+        req = Request(
+            url=server.urljoin("/scroll.html"),
+            meta={
+                "pyppeteer": True,
+                "pyppeteer_wait_until": "domcontentloaded",
+                "pyppeteer_wait_for": PageCoroutine(
+                    "waitForFunction", "document.querySelectorAll('div.quote').length === 10"
+                ),
+            },
+        )
+        resp = await handler._download_request(req, Spider("foo"))
+        assert len(resp.css("div.quote")) == 10
+
+    await handler.browser_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_parallel_page_coroutines():
+    handler = ScrapyPyppeteerDownloadHandler(get_crawler())
+    await handler._launch_browser()
+
+    with StaticMockServer() as server:
+        title = PageCoroutine("title")
+        links = PageCoroutine("evaluate", "document.querySelectorAll('a').length")
+        req = Request(
+            url=server.urljoin("/index.html"),
+            meta={
+                "pyppeteer": True,
+                "pyppeteer_page_coroutines": [
+                    ParallelPageCoroutines(title, links),
+                    NavigationPageCoroutine("click", "a.lorem_ipsum"),
+                ],
+            },
+        )
+        resp = await handler._download_request(req, Spider("foo"))
+
+    assert title.result == "Awesome site"
+    assert links.result == 2
+    assert resp.url == server.urljoin("/lorem_ipsum.html")
+
+    timings = resp.meta["pyppeteer_timings"]
+    assert {
+        "queue",
+        "page_acquisition",
+        "navigation",
+        "page_coroutine/title",
+        "page_coroutine/evaluate",
+        "page_coroutine/click",
+        "content",
+        "page_release",
+    } == set(timings)
+    assert resp.meta["download_latency"] >= timings["navigation"]
+
+    await handler.browser_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_browser_crash():
+    crawler = get_crawler()
+    handler = ScrapyPyppeteerDownloadHandler(crawler)
+    await handler._launch_browser()
+    crashed_browser = handler.browser
+    crashed_browser.process.kill()
+    while crawler.stats.get_value("pyppeteer/browser_crash_count") is None:
+        await asyncio.sleep(0.1)
+
+    with StaticMockServer() as server:
+        req = Request(server.urljoin("/index.html"), meta={"pyppeteer": True})
+        resp = await handler._download_request(req, Spider("foo"))
+
+    assert resp.status == 200
+    assert handler.browser is not crashed_browser
+    assert crawler.stats.get_value("pyppeteer/browser_crash_count") == 1
+
+    await handler.browser_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_response_body_modes():
+    handler = ScrapyPyppeteerDownloadHandler(get_crawler())
+    await handler._launch_browser()
+
+    with StaticMockServer() as server:
+        req = Request(
+            server.urljoin("/data/quotes1.json"), meta={"pyppeteer": True, "pyppeteer_body": "raw"}
+        )
+        resp = await handler._download_request(req, Spider("foo"))
+        with open(str(Path(__file__).parent / "site/data/quotes1.json"), "rb") as f:
+            assert resp.body == f.read()
+
+        req = Request(
+            url=server.urljoin("/index.html"),
+            meta={
+                "pyppeteer": True,
+                "pyppeteer_body": PageCoroutine(
+                    "evaluate", "Array.from(document.querySelectorAll('a'), a => a.href)"
+                ),
+            },
+        )
+        resp = await handler._download_request(req, Spider("foo"))
+        assert resp.headers["Content-Type"] == b"application/json"
+        assert json.loads(resp.text) == [
+            server.urljoin("/lorem_ipsum.html"),
+            server.urljoin("/scroll.html"),
+        ]
+
+        req = Request(
+            server.urljoin("/index.html"), meta={"pyppeteer": True, "pyppeteer_body": "foo"}
+        )
+        with pytest.raises(ValueError):
+            await handler._download_request(req, Spider("foo"))
+
+    await handler.browser_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_capture_responses():
+    crawler = get_crawler()
+    handler = ScrapyPyppeteerDownloadHandler(crawler)
+    await handler._launch_browser()
+
+    with StaticMockServer() as server:
+        req = Request(
+            url=server.urljoin("/scroll.html"),
+            meta={
+                "pyppeteer": True,
+                "pyppeteer_wait_for": "div.quote",
+                "pyppeteer_capture": [r"/data/quotes\d+\.json$"],
+            },
+        )
+        await handler._download_request(req, Spider("foo"))
+
+    captured = req.meta["pyppeteer_captured"]
+    assert len(captured) == 1
+    assert captured[0].url == server.urljoin("/data/quotes1.json")
+    assert captured[0].status == 200
+    assert captured[0].json()["page"] == 1
+    assert crawler.stats.get_value("pyppeteer/capture/count") == 1
+
+    await handler.browser_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_request_timeout():
+    crawler = get_crawler(
+        settings_dict={"PYPPETEER_REQUEST_TIMEOUT": 1, "PYPPETEER_PAGE_POOL_SIZE": 1}
+    )
+    handler = ScrapyPyppeteerDownloadHandler(crawler)
+    await handler._launch_browser()
+
+    with StaticMockServer() as server:
+        req = Request(
+            url=server.urljoin("/index.html"),
+            meta={
+                "pyppeteer": True,
+                "pyppeteer_page_coroutines": [
+                    PageCoroutine("waitForSelector", "div.does-not-exist", timeout=10000),
+                ],
+            },
+        )
+        start = time()
+        with pytest.raises(RequestTimeoutError):
+            await handler._download_request(req, Spider("foo"))
+        assert time() - start < 5
+        assert crawler.stats.get_value("pyppeteer/request_timeout_count") == 1
+        assert crawler.stats.get_value("pyppeteer/request_timeout_count/render") == 1
+
+        # the page was closed, the browser is still usable
+        assert not handler.browser_pool._page_slots
+        assert crawler.stats.get_value("pyppeteer/page_count/closed") == 1
+        req = Request(
+            url=server.urljoin("/index.html"),
+            meta={"pyppeteer": True, "pyppeteer_request_timeout": 10},
+        )
+        resp = await handler._download_request(req, Spider("foo"))
+        assert resp.status == 200
+
+    await handler.browser_pool.close()
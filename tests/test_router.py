@@ -0,0 +1,71 @@
+import pytest
+from scrapy import Request
+from scrapy.http import HtmlResponse, TextResponse
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+
+from scrapy_pyppeteer._router import AdaptiveRouter
+
+
+def get_response(url, body, status=200, cls=HtmlResponse):
+    return cls(url=url, body=body, encoding="utf-8", status=status)
+
+
+def is_empty(response):
+    return not response.css("div.quote")
+
+
+def test_router_needs_rendering():
+    router = AdaptiveRouter(stats=get_crawler().stats, selector="div.quote", min_body_size=20)
+    request = Request("https://example.org")
+    body = "<div class='quote'>To be or not to be</div>"
+    assert router.needs_rendering(request, get_response(request.url, body)) is None
+    assert router.needs_rendering(request, get_response(request.url, "<p>")) == "selector"
+    assert router.needs_rendering(request, get_response(request.url, "<p>", 404)) is None
+    response = get_response(request.url, "{}", cls=TextResponse)
+    assert router.needs_rendering(request, response) is None
+
+    # the pyppeteer_wait_for meta key replaces the selector from the settings
+    request = Request("https://example.org", meta={"pyppeteer_wait_for": "p"})
+    assert router.needs_rendering(request, get_response(request.url, "<p>")) == "body_size"
+
+
+def test_router_from_settings():
+    settings = Settings(
+        {
+            "PYPPETEER_ADAPTIVE_DETECTOR": "tests.test_router.is_empty",
+            "PYPPETEER_ADAPTIVE_KEY": "path",
+        }
+    )
+    router = AdaptiveRouter.from_settings(settings, get_crawler().stats)
+    request = Request("https://example.org/quotes/1")
+    body = "<noscript>Please enable JavaScript to continue</noscript>"
+    assert router.needs_rendering(request, get_response(request.url, body)) == "marker"
+    assert router.needs_rendering(request, get_response(request.url, "<p>")) == "detector"
+    assert router._get_key(request) == "example.org/quotes"
+
+    with pytest.raises(ValueError):
+        AdaptiveRouter(stats=get_crawler().stats, key="url")
+
+
+def test_router_learning():
+    stats = get_crawler().stats
+    router = AdaptiveRouter(stats=stats, threshold=2)
+    first, second = Request("https://example.org/1"), Request("https://example.org/2")
+    other = Request("https://example.com")
+    assert router.escalation_rate() is None
+
+    router.record(first, "selector")
+    router.record(second, None)  # resets the consecutive escalations
+    router.record(first, "selector")
+    assert not router.use_browser(first)
+    router.record(first, "marker")
+    assert router.use_browser(first)
+    assert router.use_browser(second)
+    assert not router.use_browser(other)
+
+    assert stats.get_value("pyppeteer/adaptive/http") == 1
+    assert stats.get_value("pyppeteer/adaptive/escalated") == 3
+    assert stats.get_value("pyppeteer/adaptive/escalated/selector") == 2
+    assert stats.get_value("pyppeteer/adaptive/browser_keys") == 1
+    assert router.escalation_rate() == 0.75
@@ -0,0 +1,48 @@
+import re
+
+from scrapy.settings import Settings
+
+from scrapy_pyppeteer._rules import AbortRules
+
+
+def test_abort_rules_empty():
+    rules = AbortRules()
+    assert not rules
+    assert not rules.should_abort("https://example.org/image.png", "image")
+
+
+def test_abort_rules_resource_types():
+    rules = AbortRules(resource_types=["Image", "font"])
+    assert rules
+    assert rules.should_abort("https://example.org/image.png", "image")
+    assert rules.should_abort("https://example.org/font.woff", "font")
+    assert not rules.should_abort("https://example.org/main.css", "stylesheet")
+
+
+def test_abort_rules_url_patterns():
+    rules = AbortRules(url_patterns=["*.png", re.compile(r"/ads?/")])
+    assert rules.should_abort("https://example.org/image.png", "image")
+    assert not rules.should_abort("https://example.org/image.png?size=2", "image")
+    assert rules.should_abort("https://example.org/ad/banner.js", "script")
+    assert rules.should_abort("https://example.org/ads/banner.js", "script")
+    assert not rules.should_abort("https://example.org/main.js", "script")
+
+
+def test_abort_rules_domains():
+    rules = AbortRules(allowed_domains=["example.org"], denied_domains=["cdn.example.org"])
+    assert not rules.should_abort("https://example.org/main.js", "script")
+    assert not rules.should_abort("https://www.example.org/main.js", "script")
+    assert rules.should_abort("https://cdn.example.org/main.js", "script")
+    assert rules.should_abort("https://tracker.example/main.js", "script")
+    assert rules.should_abort("https://notexample.org/main.js", "script")
+
+
+def test_abort_rules_from_settings_and_meta():
+    settings = Settings({"PYPPETEER_ABORT_RESOURCE_TYPES": "image,media"})
+    rules = AbortRules.from_settings(settings)
+    assert rules.resource_types == {"image", "media"}
+    assert AbortRules.from_meta(rules) is rules
+    assert AbortRules.from_meta({"denied_domains": ["example.org"]}).denied_domains == (
+        "example.org",
+    )
+    assert not AbortRules.from_meta(None)
@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+
+import pytest
+from scrapy import Request
+from scrapy.utils.test import get_crawler
+
+from scrapy_pyppeteer._overrides import RequestOverrides
+from scrapy_pyppeteer._rules import AbortRules
+from scrapy_pyppeteer._stats import PageStats
+from scrapy_pyppeteer.handler import _request_handler, _response_handler
+
+
+class MockRequest:
+    def __init__(self, url, resource_type="script", navigation=False, parent_frame=None):
+        self.url = url
+        self.method = "GET"
+        self.headers = {}
+        self.resourceType = resource_type
+        self.navigation = navigation
+        self.frame = SimpleNamespace(parentFrame=parent_frame)
+        self.action = None
+
+    def isNavigationRequest(self):
+        return self.navigation
+
+    async def abort(self):
+        self.action = "abort"
+
+    async def continue_(self, overrides):
+        self.action = "continue"
+
+
+class MockResponse:
+    def __init__(self, request, status=200):
+        self.request = request
+        self.status = status
+
+
+async def handle_page(page_stats):
+    overrides = RequestOverrides(Request("https://example.org"))
+    abort_rules = AbortRules(resource_types=["image"])
+    requests = [
+        MockRequest("https://example.org", "document", navigation=True),
+        MockRequest("https://example.org/main.js"),
+        MockRequest("https://example.org/image.png", "image"),
+    ]
+    for request in requests:
+        await _request_handler(request, overrides, page_stats, abort_rules)
+    for request in requests[:2]:
+        await _response_handler(MockResponse(request), page_stats)
+    return requests
+
+
+@pytest.mark.asyncio
+async def test_page_stats():
+    stats = get_crawler().stats
+    page_stats = PageStats()
+    requests = await handle_page(page_stats)
+    assert [request.action for request in requests] == ["continue", "continue", "abort"]
+    assert stats.get_stats() == {}
+
+    page_stats.flush(stats)
+    assert not page_stats.counts
+    assert stats.get_stats() == {
+        "pyppeteer/request_count": 3,
+        "pyppeteer/request_count/allowed": 2,
+        "pyppeteer/request_count/aborted": 1,
+        "pyppeteer/request_count/aborted/image": 1,
+        "pyppeteer/request_count/navigation": 1,
+        "pyppeteer/request_method_count/GET": 2,
+        "pyppeteer/response_count": 2,
+        "pyppeteer/response_status_count/200": 2,
+    }
+
+    page_stats.flush(stats)  # counters are only added once
+    assert stats.get_value("pyppeteer/request_count") == 3
+
+
+@pytest.mark.asyncio
+async def test_page_stats_without_subresources():
+    stats = get_crawler().stats
+    page_stats = PageStats(subresources=False)
+    await handle_page(page_stats)
+    page_stats.flush(stats)
+    assert stats.get_stats() == {
+        "pyppeteer/request_count": 1,
+        "pyppeteer/request_count/allowed": 1,
+        "pyppeteer/request_count/navigation": 1,
+        "pyppeteer/request_method_count/GET": 1,
+        "pyppeteer/response_count": 1,
+        "pyppeteer/response_status_count/200": 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_abort_rules_main_frame_navigation():
+    overrides = RequestOverrides(Request("https://example.org"))
+    abort_rules = AbortRules(resource_types=["document"], denied_domains=["example.net"])
+    requests = [
+        # redirect of the main request
+        MockRequest("https://example.net", "document", navigation=True),
+        # navigation of an iframe
+        MockRequest(
+            "https://example.org/frame", "document", navigation=True, parent_frame=object()
+        ),
+    ]
+    for request in requests:
+        await _request_handler(request, overrides, PageStats(), abort_rules)
+    assert [request.action for request in requests] == ["continue", "abort"]
@@ -0,0 +1,52 @@
+from time import sleep
+
+from scrapy_pyppeteer._timing import LatencyHistogram, PhaseTimer, TimingStats
+
+
+def test_phase_timer():
+    timer = PhaseTimer()
+    with timer.phase("navigation"):
+        sleep(0.01)
+    for _ in range(2):
+        with timer.phase("page_coroutine/evaluate"):
+            pass
+    assert [span[0] for span in timer.spans] == [
+        "navigation",
+        "page_coroutine/evaluate",
+        "page_coroutine/evaluate",
+    ]
+    navigation_offset = timer.spans[0][1]
+    evaluate_offset = timer.spans[1][1]
+    assert navigation_offset < evaluate_offset
+    timings = timer.timings
+    assert set(timings) == {"navigation", "page_coroutine/evaluate"}
+    assert timings["navigation"] >= 0.01
+    assert timer.elapsed >= sum(timings.values())
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) == 0
+    for i in range(1, 101):
+        histogram.add(i / 100)
+    assert histogram.count == 100
+    assert histogram.max == 1
+    # estimations are within the width of a bucket
+    assert 0.5 <= histogram.percentile(50) <= 0.5 * 1.1
+    assert 0.99 <= histogram.percentile(99) <= 1
+    assert histogram.percentile(100) == 1
+
+
+def test_timing_stats():
+    timing_stats = TimingStats()
+    timing_stats.add({"navigation": 0.5, "content": 0.01})
+    timing_stats.add({"navigation": 1.0})
+    stats = timing_stats.to_stats()
+    assert stats["pyppeteer/timing/navigation/count"] == 2
+    assert stats["pyppeteer/timing/navigation/max"] == 1.0
+    assert stats["pyppeteer/timing/content/count"] == 1
+    assert set(stats) == {
+        "pyppeteer/timing/{}/{}".format(phase, key)
+        for phase in ("navigation", "content")
+        for key in ("count", "max", "p50", "p95", "p99")
+    }